@@ -17,4 +17,5 @@ def time_message() -> dict:
 def make_time_message() -> typing.Tuple[int, typing.Callable[[], typing.Optional[dict]]]:
 
     # returns announcer period announcement will be triggered every n-th second
+    # (optional third item is a timeout in seconds, data returned later are dropped)
     return (2, time_message)
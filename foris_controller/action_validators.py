@@ -0,0 +1,201 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright 2023, CZ.NIC z.s.p.o. (https://www.nic.cz/)
+
+""" Validators of messages of a single action
+
+A module schema contains alternatives (`oneOf`) for all messages of the module. Messages are
+validated only against the alternatives which can match their (module, action, kind).
+Validators of these alternatives are created when the action is used for the first time
+and compiled by `fastjsonschema` when it is installed.
+"""
+
+import logging
+import threading
+import typing
+
+from jsonschema import ValidationError
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+from foris_controller.app import app_info
+
+logger = logging.getLogger(__name__)
+
+
+def _can_match(alternative: dict, name: str, value: str) -> bool:
+    """ Checks whether the alternative can match a message with the property set to value
+    """
+    prop = alternative.get("properties", {}).get(name)
+    if not isinstance(prop, dict) or "enum" not in prop:
+        return True  # not restricted
+    return value in prop["enum"]
+
+
+def _formats(schema: typing.Any, res: typing.Optional[set] = None) -> set:
+    """ Collects names of the formats used in the schema
+    """
+    res = set() if res is None else res
+    if isinstance(schema, dict):
+        if isinstance(schema.get("format"), str):
+            res.add(schema["format"])
+        for value in schema.values():
+            _formats(value, res)
+    elif isinstance(schema, list):
+        for value in schema:
+            _formats(value, res)
+    return res
+
+
+def _refs(schema: typing.Any, res: typing.Optional[set] = None) -> set:
+    """ Collects names of the local definitions referenced in the schema
+    """
+    res = set() if res is None else res
+    if isinstance(schema, dict):
+        ref = schema.get("$ref")
+        if isinstance(ref, str) and ref.startswith("#/definitions/"):
+            res.add(ref[len("#/definitions/"):].split("/")[0])
+        for value in schema.values():
+            _refs(value, res)
+    elif isinstance(schema, list):
+        for value in schema:
+            _refs(value, res)
+    return res
+
+
+def _used_definitions(schema: typing.Any, definitions: dict) -> dict:
+    """ Returns the definitions which are (even indirectly) referenced in the schema
+    """
+    used = {}
+    pending = _refs(schema)
+    while pending:
+        name = pending.pop()
+        if name in used or name not in definitions:
+            continue
+        used[name] = definitions[name]
+        pending |= _refs(definitions[name])
+    return used
+
+
+def _wrap_format_checker(func: typing.Callable, raises: typing.Any) -> typing.Callable:
+    def check(value):
+        try:
+            return bool(func(value))
+        except raises or ():
+            return False
+
+    return check
+
+
+class _FastValidator:
+    """ Validator compiled by fastjsonschema which raises jsonschema errors
+    """
+
+    def __init__(self, schema: dict, format_checker: typing.Any):
+        checkers = getattr(format_checker, "checkers", {})
+        formats = {}
+        for name in _formats(schema):
+            if name in checkers:
+                formats[name] = _wrap_format_checker(*checkers[name])
+            else:
+                formats[name] = lambda value: True  # unknown formats are not checked by jsonschema
+        self._validate = fastjsonschema.compile(schema, formats=formats)
+
+    def validate(self, message: dict):
+        try:
+            self._validate(message)
+        except fastjsonschema.JsonSchemaValueException as exc:
+            raise ValidationError(exc.message)
+
+
+class ActionValidators:
+    """ Cache of validators indexed by (module, action, kind)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._source: typing.Any = None  # the validator which schemas are cached
+        self._validators: typing.Dict[typing.Tuple[str, str, str], typing.Any] = {}
+
+    def _create(self, source: typing.Any, module: str, action: str, kind: str) -> typing.Any:
+        module_validator = getattr(source, "validators", {}).get(module)
+        if module_validator is None:
+            return None
+
+        schema = module_validator.schema
+        alternatives = schema.get("oneOf")
+        if not isinstance(alternatives, list):
+            return None
+        alternatives = [
+            e
+            for e in alternatives
+            if _can_match(e, "module", module)
+            and _can_match(e, "action", action)
+            and _can_match(e, "kind", kind)
+        ]
+
+        # keep everything but the alternatives and definitions which are not used
+        action_schema = {k: v for k, v in schema.items() if k not in ("oneOf", "definitions")}
+        action_schema["oneOf"] = alternatives
+        if "definitions" in schema:
+            action_schema["definitions"] = _used_definitions(alternatives, schema["definitions"])
+        meta_schema = getattr(module_validator, "META_SCHEMA", {})
+        if "$schema" not in action_schema and "$schema" in meta_schema:
+            action_schema["$schema"] = meta_schema["$schema"]
+
+        if fastjsonschema:
+            try:
+                return _FastValidator(action_schema, module_validator.format_checker)
+            except Exception:
+                logger.debug("Failed to compile schema of %s.%s (%s).", module, action, kind)
+
+        if hasattr(module_validator, "evolve"):
+            # keeps the reference resolution of the module schema
+            return module_validator.evolve(schema=action_schema)
+        return type(module_validator)(
+            action_schema,
+            resolver=module_validator.resolver,
+            format_checker=module_validator.format_checker,
+        )
+
+    def get(self, module: str, action: str, kind: str) -> typing.Any:
+        """ Returns validator of the messages of the action (None if it can't be created)
+        """
+        source = app_info["validator"]
+        key = (module, action, kind)
+        with self._lock:
+            if source is not self._source:
+                # validator was replaced => schemas could be changed
+                self._validators = {}
+                self._source = source
+            if key not in self._validators:
+                try:
+                    self._validators[key] = self._create(source, module, action, kind)
+                except Exception:
+                    logger.warning(
+                        "Failed to create validator of %s.%s (%s).", module, action, kind
+                    )
+                    self._validators[key] = None
+            return self._validators[key]
+
+    def validate(self, message: dict):
+        """ Validates the message (raises ValidationError)
+        """
+        source = app_info["validator"]
+        if "errors" in message or not hasattr(source, "base_validator"):
+            source.validate(message)
+            return
+
+        # basic format of the message (module, action, kind, ...)
+        source.base_validator.validate(message)
+
+        validator = self.get(message["module"], message["action"], message["kind"])
+        if validator is None:
+            source.validate(message)
+        else:
+            validator.validate(message)
+
+
+action_validators = ActionValidators()
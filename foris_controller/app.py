@@ -24,7 +24,13 @@ import uuid
 
 
 from foris_controller import __version__
-from foris_controller.utils import get_modules, get_handler, get_module_class, get_validator_dirs
+from foris_controller.utils import (
+    TTLCache,
+    get_modules,
+    get_handler,
+    get_module_class,
+    get_validator_dirs,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -53,16 +59,30 @@ def set_app_info(program_options):
     app_info["lock_backend"] = multiprocessing if app_info["bus"] in ["ubus"] else threading
     if app_info["bus"] == "ubus":
         app_info["ubus_single_process"] = program_options.single
+        app_info["ubus_processes"] = program_options.ubus_processes
+        app_info["ubus_reply_chunk_size"] = program_options.reply_chunk_size
 
     controller_id = getattr(program_options, "controller_id", None)
     app_info["controller_id"] = controller_id or f"{uuid.getnode():016X}"
 
     app_info["mqtt_credentials"] = getattr(program_options, "passwd_file", None)
     app_info["mqtt_announcer_period"] = getattr(program_options, "announcer_period", None)
+    app_info["mqtt_announcer_heartbeat"] = getattr(program_options, "announcer_heartbeat", None)
+    app_info["mqtt_v5"] = getattr(program_options, "mqtt_v5", False)
+    app_info["mqtt_workers"] = getattr(program_options, "mqtt_workers", None)
+    app_info["mqtt_queue_size"] = getattr(program_options, "mqtt_queue_size", None)
 
     app_info["zeroconf_devices"] = getattr(program_options, "zeroconf_devices", [])
     app_info["zeroconf_port"] = getattr(program_options, "zeroconf_port", 11884)
 
+    capability_cache_ttl = getattr(program_options, "capability_cache_ttl", None)
+    if capability_cache_ttl is not None:
+        TTLCache.default_ttl = capability_cache_ttl
+    app_info["capability_cache_ttl"] = TTLCache.default_ttl
+
+    app_info["validate_output"] = getattr(program_options, "validate_output", None)
+    app_info["validate_output_rate"] = getattr(program_options, "validate_output_rate", None)
+
 
 def _gen_notify(module_name):
     """ Generator for notify function which wrapps module name inside the notify call
@@ -17,11 +17,13 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 #
 
+import hashlib
+import heapq
+import itertools
 import logging
 import json
 import uuid
 import os
-import re
 import socket
 import sys
 import threading
@@ -29,12 +31,15 @@ import time
 import typing
 import pkg_resources
 
+from concurrent.futures import Future, ThreadPoolExecutor
 from distutils.util import strtobool
 
 from paho.mqtt import client as mqtt
-from paho.mqtt.publish import single
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 from jsonschema import ValidationError
 
+from foris_controller import compression
 from foris_controller.app import app_info
 from foris_controller.message_router import Router
 from foris_controller.utils import get_modules
@@ -44,22 +49,200 @@ from .base import BaseNotificationSender, BaseSocketListener, get_method_names_f
 logger = logging.getLogger(__name__)
 
 
-bus_info = {"bus_thread": None}
+bus_info = {"bus_thread": None, "announcer_scheduler": None}
 
 ANNOUNCER_PERIOD_DEFAULT = 1.0  # in seconds
+ANNOUNCER_HEARTBEAT_DEFAULT = 30.0  # in seconds
+NETBOOT_CHECK_PERIOD = 10.0  # in seconds
+ANNOUNCER_TIMEOUT_DEFAULT = 10.0  # in seconds
+ANNOUNCER_WORKERS = 2
 CLEAR_RETAIN_PERIOD = 10.0  # in seconds
+CLEAR_RETAIN_BATCH_WINDOW = 1.0  # in seconds
+PUBLISH_TIMEOUT = 10.0  # in seconds
+WORKERS_DEFAULT = 8
+QUEUE_SIZE_DEFAULT = 64
+
+
+class Scheduler:
+    """ Calls callbacks at the scheduled time from a single thread using a timer heap
+
+    Entries of the same callback which are due are passed to a single call of the callback
+    (`callback(items)`), so the callback can process them in a batch. Entries which are due
+    within `batch_window` are processed together with the ones which are already due.
+    """
+
+    def __init__(self, name: str, batch_window: float = 0.0):
+        self.batch_window = batch_window
+        # (time, sequence number, callback, item)
+        self._heap: typing.List[tuple] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        threading.Thread(name=name, target=self._run, daemon=True).start()
+
+    @property
+    def backlog(self) -> int:
+        """ Number of entries which are waiting to be processed
+        """
+        with self._cond:
+            return len(self._heap)
+
+    def schedule(self, delay: float, callback: typing.Callable[[list], None], item: typing.Any):
+        with self._cond:
+            entry = (time.monotonic() + delay, next(self._counter), callback, item)
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._cond.notify()
+
+    def _pop_due(self) -> typing.Dict[typing.Callable[[list], None], list]:
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                remaining = self._heap[0][0] - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                break
+
+            limit = time.monotonic() + self.batch_window
+            batches: typing.Dict[typing.Callable[[list], None], list] = {}
+            while self._heap and self._heap[0][0] <= limit:
+                _, _, callback, item = heapq.heappop(self._heap)
+                batches.setdefault(callback, []).append(item)
+            return batches
+
+    def _run(self):
+        while True:
+            for callback, items in self._pop_due().items():
+                try:
+                    callback(items)
+                except Exception:
+                    logger.exception("Scheduled callback failed.")
 
 
 class EntryPointAnnouncer:
-    def __init__(self, period: int, callback: typing.Callable[[], typing.Optional[dict]]):
+    """ Announcer provided by `foris_controller_announcer` entry point
+
+    The entry point returns `(period, callback)` or `(period, callback, timeout)`.
+    Data which the callback returns after the timeout are dropped.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        period: float,
+        callback: typing.Callable[[], typing.Optional[dict]],
+        timeout: float = ANNOUNCER_TIMEOUT_DEFAULT,
+    ):
+        self.name = name
         self.callback = callback
         self.period = period
-        self.last_called = 0
+        self.timeout = timeout
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.last_duration: typing.Optional[float] = None
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "period": self.period,
+            "timeout": self.timeout,
+            "runs": self.runs,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "last_duration": self.last_duration,
+            "max_duration": self.max_duration,
+            "avg_duration": self.total_duration / self.runs if self.runs else None,
+        }
+
+    def run(self) -> typing.Optional[dict]:
+        start = time.monotonic()
+        try:
+            res = self.callback()
+        except Exception:
+            logger.exception("Announcer '%s' failed.", self.name)
+            res = None
+            self.failures += 1
+        duration = time.monotonic() - start
+
+        self.runs += 1
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        self.total_duration += duration
+
+        if duration > self.timeout:
+            logger.warning(
+                "Announcer '%s' took %.2f s (timeout %.2f s), dropping its data.",
+                self.name,
+                duration,
+                self.timeout,
+            )
+            self.timeouts += 1
+            return None
+        return res
+
+
+class AnnouncerScheduler:
+    """ Runs entry point announcers on a small pool of threads
+
+    Next runs are kept in a timer heap. An announcer is scheduled again after its run finishes
+    so a slow announcer delays only itself.
+    """
+
+    def __init__(self, publish: typing.Callable[[dict], None], workers: int = ANNOUNCER_WORKERS):
+        self.publish = publish
+        self.announcers: typing.List[EntryPointAnnouncer] = []
+        self.scheduler = Scheduler("announcer_scheduler")
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="announcer")
+        self.stopped = False
+
+    def add(self, announcer: EntryPointAnnouncer):
+        self.announcers.append(announcer)
+        self.scheduler.schedule(announcer.period, self._submit, announcer)
+
+    def stats(self) -> typing.Dict[str, dict]:
+        """ Returns timing stats of announcers indexed by their names
+        """
+        return {e.name: e.stats for e in self.announcers}
+
+    def stop(self):
+        self.stopped = True
+        self.executor.shutdown(wait=False)
+
+    def _submit(self, announcers: typing.List[EntryPointAnnouncer]):
+        for announcer in announcers:
+            if self.stopped:
+                return
+            started = time.monotonic()
+            future = self.executor.submit(announcer.run)
+            future.add_done_callback(
+                lambda future, announcer=announcer, started=started: self._done(
+                    announcer, started, future
+                )
+            )
+            self.scheduler.schedule(announcer.timeout, self._check_timeouts, (announcer, future))
+
+    def _check_timeouts(self, runs: typing.List[typing.Tuple[EntryPointAnnouncer, Future]]):
+        for announcer, future in runs:
+            if not future.done():
+                logger.warning(
+                    "Announcer '%s' is still running after %.2f s.",
+                    announcer.name,
+                    announcer.timeout,
+                )
 
-    def get_data(self, counter: int) -> typing.Optional[dict]:
-        if self.period + self.last_called <= counter:
-            self.last_called = counter
-            return self.callback()
+    def _done(self, announcer: EntryPointAnnouncer, started: float, future: Future):
+        if self.stopped:
+            return
+        res = future.result()
+        if res:
+            self.publish(res)
+        delay = max(0.0, started + announcer.period - time.monotonic())
+        self.scheduler.schedule(delay, self._submit, announcer)
 
 
 class AdvertizementBase:
@@ -67,6 +250,7 @@ class AdvertizementBase:
 
     def __init__(self, state):
         self.state = state
+        self.cache_disabled = strtobool(os.environ.get("FC_DISABLE_ADV_CACHE", "0"))
         self.refresh()
 
     def refresh(self):
@@ -74,6 +258,7 @@ class AdvertizementBase:
         self.hostname = socket.gethostname()
         self.modules = [{"name": k, "version": v.version} for k, v in app_info["modules"].items()]
         self.netboot = "unknown"  # initial state
+        self.netboot_checked: typing.Optional[float] = None
         self.get_netboot()
 
     def get_netboot(self):
@@ -81,13 +266,22 @@ class AdvertizementBase:
         if self.netboot in self.NETBOOT_FINAL:
             # netboot state will not change
             return
+        now = time.monotonic()
+        if (
+            not self.cache_disabled
+            and self.netboot_checked is not None
+            and now - self.netboot_checked < NETBOOT_CHECK_PERIOD
+        ):
+            # don't run the check too often
+            return
+        self.netboot_checked = now
         try:
             self.netboot = app_info["modules"]["remote"].handler.get_netboot_status()
         except Exception:
             pass
 
     def build(self) -> dict:
-        if strtobool(os.environ.get("FC_DISABLE_ADV_CACHE", "0")):
+        if self.cache_disabled:
             self.refresh()
         self.get_netboot()  # try to update netboot state
         return {
@@ -99,36 +293,79 @@ class AdvertizementBase:
         }
 
 
-def _publish(client: mqtt.Client, msg: dict):
-    ANNOUNCER_TOPIC = (
+def _notification_topic(msg: dict) -> str:
+    return (
         f"foris-controller/{app_info['controller_id']}/notification/"
         f"{msg['module']}/action/{msg['action']}"
     )
+
+
+def _publish(client: mqtt.Client, msg: dict):
     try:
         logger.debug("Starting to validate announcement notification.")
         # Hope that calling validator is treadsafe otherwise
         # some locking mechanism should be implemented
         app_info["validator"].validate(msg)
         logger.debug("Publishing announcement notification. (%s)", msg)
-        client.publish(ANNOUNCER_TOPIC, json.dumps(msg), qos=0)
+        client.publish(_notification_topic(msg), json.dumps(msg), qos=0)
     except ValidationError as exc:
         logger.error("Failed to validate announcement notification.")
         logger.debug("Error: \n%s" % str(exc))
 
 
-def _publish_advertize(
-    client: mqtt.Client,
-    adv_base: AdvertizementBase,
-    working_replies: typing.Dict[str, typing.Tuple[threading.Thread, float]],
-    working_replies_lock: threading.Lock,
-):
-    data = adv_base.build()
+class Advertizer:
+    """ Publishes advertizements of the controller
 
-    with working_replies_lock:
-        data["working_replies"]: typing.List[str] = [e for e in working_replies.keys()]
+    An advertizement is validated and serialized only when its content changes. A changed
+    advertizement is published right away, the same one is published again once per heartbeat.
+    """
 
-    msg = {"module": "remote", "action": "advertize", "kind": "notification", "data": data}
-    _publish(client, msg)
+    MSG_BASE = {"module": "remote", "action": "advertize", "kind": "notification"}
+
+    def __init__(
+        self,
+        client: mqtt.Client,
+        working_replies: typing.Dict[str, float],
+        working_replies_lock: threading.Lock,
+        heartbeat: float,
+    ):
+        self.client = client
+        self.working_replies = working_replies
+        self.working_replies_lock = working_replies_lock
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._data: typing.Optional[dict] = None
+        self._payload: typing.Optional[str] = None
+        self._published: typing.Optional[float] = None
+
+    def publish(self, adv_base: AdvertizementBase, force: bool = False):
+        """ Publishes the advertizement when it was changed or the heartbeat is due
+
+        :param force: publish even when the advertizement is the same
+        """
+        data = adv_base.build()
+        with self.working_replies_lock:
+            data["working_replies"] = [e for e in self.working_replies.keys()]
+
+        with self._lock:
+            now = time.monotonic()
+            if data != self._data:
+                msg = {**self.MSG_BASE, "data": data}
+                try:
+                    logger.debug("Starting to validate advertizement.")
+                    app_info["validator"].validate(msg)
+                except ValidationError as exc:
+                    logger.error("Failed to validate advertizement.")
+                    logger.debug("Error: \n%s" % str(exc))
+                    return
+                self._data = data
+                self._payload = json.dumps(msg)
+            elif not force and now - self._published < self.heartbeat:
+                return
+
+            logger.debug("Publishing advertizement. (%s)", self._payload)
+            self.client.publish(_notification_topic(self.MSG_BASE), self._payload, qos=0)
+            self._published = now
 
 
 def announcer_worker(host, port, working_replies, working_replies_lock):
@@ -136,9 +373,7 @@ def announcer_worker(host, port, working_replies, working_replies_lock):
         logger.debug("Announcer handles connect.")
         if rc == 0:
             logger.debug("Announcer thread connected.")
-            _publish_advertize(
-                client, AdvertizementBase("started"), working_replies, working_replies_lock
-            )
+            advertizer.publish(AdvertizementBase("started"), force=True)
         else:
             logger.error("Failed to connect announcer thread!")
 
@@ -146,6 +381,12 @@ def announcer_worker(host, port, working_replies, working_replies_lock):
         logger.debug("Announcer thread published.")
 
     client = mqtt.Client(client_id=f"{uuid.uuid4()}-controller-announcer", clean_session=False)
+    advertizer = Advertizer(
+        client,
+        working_replies,
+        working_replies_lock,
+        app_info.get("mqtt_announcer_heartbeat") or ANNOUNCER_HEARTBEAT_DEFAULT,
+    )
     client.on_connect = on_connect
     client.on_publish = on_publish
     logger.debug("Announcer thread started. Trying to connect to '%s':'%d'", host, port)
@@ -155,43 +396,186 @@ def announcer_worker(host, port, working_replies, working_replies_lock):
 
     client.loop_start()
 
-    counter = 1
-
     # perpare entry points
-    announcers: typing.List[EntryPointAnnouncer] = []
-    for entry_point in pkg_resources.iter_entry_points("foris_controller_announcer"):
-        logger.debug("Loading announcer entry point %s", entry_point.name)
-        period, callback = entry_point.load()()
-        announcers.append(EntryPointAnnouncer(period, callback))
+    announcer_scheduler = AnnouncerScheduler(lambda msg: _publish(client, msg))
+    bus_info["announcer_scheduler"] = announcer_scheduler
+    if app_info["mqtt_announcer_period"]:
+        for entry_point in pkg_resources.iter_entry_points("foris_controller_announcer"):
+            logger.debug("Loading announcer entry point %s", entry_point.name)
+            announcer_scheduler.add(EntryPointAnnouncer(entry_point.name, *entry_point.load()()))
 
     running_adv = AdvertizementBase("running")
     while bus_info["bus_thread"].is_alive():
         time.sleep(app_info["mqtt_announcer_period"] or ANNOUNCER_PERIOD_DEFAULT)
         if app_info["mqtt_announcer_period"]:
-            _publish_advertize(
-                client, running_adv, working_replies, working_replies_lock
-            )
-            for announcer in announcers:
-                res = announcer.get_data(counter)
-                if res:
-                    _publish(client, res)
-
-        counter += app_info["mqtt_announcer_period"]
+            advertizer.publish(running_adv)
 
-    _publish_advertize(
-        client, AdvertizementBase("exited"), working_replies, working_replies_lock
-    )
+    announcer_scheduler.stop()
+    logger.debug("Announcer stats: %s", announcer_scheduler.stats())
+    advertizer.publish(AdvertizementBase("exited"), force=True)
     client.loop_stop()
 
 
+class TopicRouter:
+    """ Maps topics to handlers using a trie of topic levels
+
+    Level `+` of a topic filter matches any single level of the topic.
+    The matched levels are passed to the handler.
+    """
+
+    def __init__(self):
+        self.filters: typing.List[str] = []
+        self._root: dict = {}  # level -> node (handler is stored under None key)
+
+    def add(self, topic_filter: str, handler: typing.Callable):
+        node = self._root
+        for level in topic_filter.split("/"):
+            node = node.setdefault(level, {})
+        node[None] = handler
+        self.filters.append(topic_filter)
+
+    def match(
+        self, topic: str
+    ) -> typing.Tuple[typing.Optional[typing.Callable], typing.List[str]]:
+        """ Finds the handler of the topic
+
+        :returns: (handler, levels matched by `+`) or (None, []) when no filter matches the topic
+        """
+        return self._match(self._root, topic.split("/"), 0)
+
+    def _match(self, node: dict, levels: typing.List[str], index: int):
+        if index == len(levels):
+            return node.get(None), []
+
+        child = node.get(levels[index])
+        if child is not None:
+            handler, args = self._match(child, levels, index + 1)
+            if handler:
+                return handler, args
+
+        child = node.get("+")
+        if child is not None:
+            handler, args = self._match(child, levels, index + 1)
+            if handler:
+                return handler, [levels[index]] + args
+
+        return None, []
+
+
+class PreparedResponse(typing.NamedTuple):
+    payload: bytes  # serialized response
+    digest: str  # sha256 of the payload
+
+
+class IntrospectionResponses:
+    """ Serialized responses to introspection requests (modules, actions and schemas)
+
+    Responses are prepared once and prepared again only when the loaded modules change.
+    Schemas are serialized with sorted keys, so their hashes are stable between restarts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprint: typing.Optional[tuple] = None
+        self._responses: typing.Dict[str, PreparedResponse] = {}
+        self._schemas: typing.Dict[str, typing.Tuple[str, dict]] = {}  # name -> (hash, schema)
+
+    @staticmethod
+    def _modules_fingerprint() -> tuple:
+        return (
+            tuple(app_info.get("filter_modules") or ()),
+            tuple(app_info.get("extra_module_paths") or ()),
+            tuple((k, getattr(v, "version", None)) for k, v in app_info.get("modules", {}).items()),
+        )
+
+    @staticmethod
+    def _prepare(data: typing.Any) -> PreparedResponse:
+        payload = json.dumps(data, sort_keys=True).encode("utf8")
+        return PreparedResponse(payload, hashlib.sha256(payload).hexdigest())
+
+    def _prepare_all(self):
+        modules = MqttListener.list_modules()
+        schemas = MqttListener.get_named_schemas()
+        self._responses = {
+            "list": self._prepare(modules),
+            "jsonschemas": self._prepare(list(schemas.values())),
+        }
+        for module in modules:
+            self._responses[f"actions/{module['name']}"] = self._prepare(module["actions"])
+        self._schemas = {k: (self._prepare(v).digest, v) for k, v in schemas.items()}
+
+    def _update(self):
+        fingerprint = self._modules_fingerprint()
+        if fingerprint != self._fingerprint:
+            logger.debug("Preparing introspection responses.")
+            self._prepare_all()
+            self._fingerprint = fingerprint
+
+    def get(self, key: str) -> typing.Optional[PreparedResponse]:
+        """ Returns prepared response
+
+        :param key: "list", "jsonschemas" or "actions/<module_name>"
+        :returns: the response or None when there is no such response
+        """
+        with self._lock:
+            self._update()
+            return self._responses.get(key)
+
+    def list_actions(self, module_name: str) -> bytes:
+        response = self.get(f"actions/{module_name}")
+        return response.payload if response else b"[]"
+
+    def get_schemas(self, request: dict) -> typing.Union[bytes, dict]:
+        """ Returns schemas which the client doesn't have yet
+
+        :param request: may contain "hash" (hash of the entire schema) and "hashes"
+                        (schema name -> hash) which the client already has
+        :returns: serialized list of all schemas when no hashes are present in the request,
+                  otherwise the hashes of all schemas and the schemas which differ
+                  ("not_modified" is set when the hash of the entire schema matches)
+        """
+        with self._lock:
+            self._update()
+            merged = self._responses["jsonschemas"]
+            schemas = self._schemas
+
+        if "hash" not in request and "hashes" not in request:
+            return merged.payload
+
+        if request.get("hash") == merged.digest:
+            return {"hash": merged.digest, "not_modified": True}
+
+        known = request.get("hashes")
+        known = known if isinstance(known, dict) else {}
+        return {
+            "hash": merged.digest,
+            "hashes": {name: digest for name, (digest, _) in schemas.items()},
+            "schemas": {
+                name: schema for name, (digest, schema) in schemas.items()
+                if known.get(name) != digest
+            },
+        }
+
+
+def _make_client(client_id: str) -> mqtt.Client:
+    """ Creates a client which uses MQTT v5 when it is enabled (MQTT v3.1.1 otherwise)
+    """
+    if app_info.get("mqtt_v5"):
+        return mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5)
+    return mqtt.Client(client_id=client_id, clean_session=False)
+
+
+def _connect_kwargs() -> dict:
+    return {"clean_start": False} if app_info.get("mqtt_v5") else {}
+
+
 class MqttListener(BaseSocketListener):
     router = Router()
     subscriptions: typing.Dict[int, bool] = {}
 
-    @staticmethod
-    def handle_on_connect(client, userdata, flags, rc):
+    def handle_on_connect(self, client, userdata, flags, rc, properties=None):
         if rc != 0:
-            logger.error("Failed to connect to the message bus (rc=%d).", rc)
+            logger.error("Failed to connect to the message bus (rc=%s).", rc)
             sys.exit(1)  # can't connect to bus -> exitting
 
         logger.debug(
@@ -213,20 +597,55 @@ class MqttListener(BaseSocketListener):
             check_subscription(rc, mid, topic)
             logger.debug("Subscribing to '%s'." % topic)
 
+        for topic_filter in self.topic_router.filters:
+            subscribe(topic_filter)
+
+    def _prepare_topic_router(self) -> TopicRouter:
+        """ Prepares topics to subscribe and their handlers
+
+        Handlers are called with (reply_topic, reply_id, properties, reply compression,
+        parsed payload, *matched levels) and they return the response or its serialized form
+        (None when the reply is sent elsewhere).
+        """
+        prefix = f"foris-controller/{app_info['controller_id']}"
+
+        def handle_action(
+            reply_topic, reply_id, properties, reply_compression, parsed, module_name, action_name
+        ):
+            msg = {"module": module_name, "kind": "request", "action": action_name}
+            if "data" in parsed:
+                msg["data"] = parsed["data"]
+            self.start_message_worker(reply_topic, reply_id, msg, properties, reply_compression)
+            return None  # reply will be performed elsewhere
+
+        router = TopicRouter()
+
         # subscription for listing modules
-        subscribe(f"foris-controller/{app_info['controller_id']}/list")
+        router.add(f"{prefix}/list", lambda *args: self.introspection.get("list").payload)
 
         # subscription for listing working replies
-        subscribe(f"foris-controller/{app_info['controller_id']}/working_replies")
+        router.add(f"{prefix}/working_replies", lambda *args: self.list_working_replies())
 
         # subscription for obtaining the entire schema
-        subscribe(f"foris-controller/{app_info['controller_id']}/jsonschemas")
+        router.add(
+            f"{prefix}/jsonschemas",
+            lambda reply_topic, reply_id, properties, reply_compression, parsed: (
+                self.introspection.get_schemas(parsed)
+            ),
+        )
 
         # subscription for listing module actions
-        subscribe(f"foris-controller/{app_info['controller_id']}/request/+/list")
+        router.add(
+            f"{prefix}/request/+/list",
+            lambda reply_topic, reply_id, properties, reply_compression, parsed, module_name: (
+                self.introspection.list_actions(module_name)
+            ),
+        )
 
         # listen to all requests for my node
-        subscribe(f"foris-controller/{app_info['controller_id']}/request/+/action/+")
+        router.add(f"{prefix}/request/+/action/+", handle_action)
+
+        return router
 
     @staticmethod
     def list_modules():
@@ -238,10 +657,15 @@ class MqttListener(BaseSocketListener):
         return res
 
     @staticmethod
-    def get_schema():
-        return [app_info["validator"].base_validator.schema, app_info["validator"].error_schema] + [
-            e.schema for e in app_info["validator"].validators.values()
-        ]
+    def get_named_schemas() -> typing.Dict[str, dict]:
+        """ Returns the schemas indexed by name (base, error and then the modules)
+        """
+        res = {
+            "base": app_info["validator"].base_validator.schema,
+            "error": app_info["validator"].error_schema,
+        }
+        res.update({k: e.schema for k, e in app_info["validator"].validators.items()})
+        return res
 
     @staticmethod
     def list_actions(module_name):
@@ -252,100 +676,212 @@ class MqttListener(BaseSocketListener):
         with self.working_replies_lock:
             return [e for e in self.working_replies.keys()]
 
-    def start_message_worker(self, reply_topic: str, reply_id: str, msg: dict):
-        """ Performs the work and sends the reply
+    def _connect_reply_client(self) -> mqtt.Client:
+        """ Connects the client which publishes the replies
+
+        The client runs its own network thread and reconnects automatically.
+        """
+
+        def on_connect(client, userdata, flags, rc, properties=None):
+            if rc == 0:
+                logger.debug("Reply client connected.")
+            else:
+                logger.error("Reply client failed to connect (rc=%s).", rc)
+
+        def on_disconnect(client, userdata, rc, properties=None):
+            logger.debug("Reply client disconnected (rc=%s).", rc)
+
+        client = _make_client(f"{uuid.uuid4()}-controller-reply")
+        client.on_connect = on_connect
+        client.on_disconnect = on_disconnect
+        if app_info["mqtt_credentials"]:
+            client.username_pw_set(*app_info["mqtt_credentials"])
+        client.reconnect_delay_set(min_delay=1, max_delay=10)
+        client.connect_async(self.host, self.port, keepalive=30, **_connect_kwargs())
+        client.loop_start()
+        return client
+
+    def _publish_retained(
+        self, topic: str, payload: str, properties: typing.Optional[Properties] = None
+    ) -> typing.Optional[mqtt.MQTTMessageInfo]:
+        """ Publishes retained message using the reply client
+
+        :param properties: MQTT v5 response properties (message is not retained when set)
+        :returns: info to track the publishing or None when the message was not sent now
+        """
+        info = self.reply_client.publish(
+            topic, payload, qos=1, retain=properties is None, properties=properties
+        )
+        if info.rc == mqtt.MQTT_ERR_NO_CONN:
+            # message is queued and will be sent once the client is reconnected
+            logger.warning("Reply client is not connected (message to '%s' queued)", topic)
+            return None
+        return info
+
+    def _wait_published(self, topic: str, info: mqtt.MQTTMessageInfo, timeout: float) -> bool:
+        """ Waits till the broker confirms the message
+
+        :returns: True if the broker confirmed the message
+        """
+        try:
+            info.wait_for_publish(max(timeout, 0.0))
+        except (ValueError, RuntimeError) as exc:
+            logger.error("Publishing message to '%s' failed (%s)", topic, exc)
+            return False
+        if not info.is_published():
+            logger.warning("Publishing message to '%s' timed out", topic)
+            return False
+        return True
+
+    def _publish_reply(
+        self,
+        reply_topic: str,
+        response: dict,
+        properties: typing.Optional[Properties] = None,
+        reply_compression: typing.Optional[str] = None,
+    ):
+        logger.debug("Publishing response '%s' to '%s'", response, reply_topic)
+        payload = compression.encode(json.dumps(response).encode("utf8"), reply_compression)
+        info = self._publish_retained(reply_topic, payload, properties)
+        if info:
+            self._wait_published(reply_topic, info, PUBLISH_TIMEOUT)
+
+    def _clear_retained(self, replies: typing.List[typing.Tuple[str, str]]):
+        """ Clears the retained replies (all messages are sent before waiting for confirmations)
+
+        :param replies: [(reply_topic, reply_id), ...]
+        """
+        logger.debug(
+            "Clearing %d retained replies (%d waiting).", len(replies), self.scheduler.backlog
+        )
+        infos = [(topic, self._publish_retained(topic, "")) for topic, _ in replies]
+
+        deadline = time.monotonic() + PUBLISH_TIMEOUT
+        for reply_topic, info in infos:
+            if info and self._wait_published(reply_topic, info, deadline - time.monotonic()):
+                logger.debug("Retained messages '%s' should be cleared", reply_topic)
+
+        # unmark reply_ids as working replies
+        with self.working_replies_lock:
+            for _, reply_id in replies:
+                self.working_replies.pop(reply_id, None)
+
+    def _schedule_clear(self, reply_topic: str, reply_id: str):
+        # the clear might be batched with the ones which are due sooner, so it is delayed
+        self.scheduler.schedule(
+            CLEAR_RETAIN_PERIOD + CLEAR_RETAIN_BATCH_WINDOW,
+            self._clear_retained,
+            (reply_topic, reply_id),
+        )
+
+    def _finish_reply(
+        self, reply_topic: str, reply_id: str, properties: typing.Optional[Properties]
+    ):
+        if properties is None:
+            self._schedule_clear(reply_topic, reply_id)
+        else:
+            # reply was not retained => there is nothing to clear
+            with self.working_replies_lock:
+                self.working_replies.pop(reply_id, None)
+
+    def start_message_worker(
+        self,
+        reply_topic: str,
+        reply_id: str,
+        msg: dict,
+        properties: typing.Optional[Properties] = None,
+        reply_compression: typing.Optional[str] = None,
+    ):
+        """ Queues the message to be processed by a worker which sends the reply
         :param reply_topic: where the reply is supposed to be send
         :param reply_id: id of reply
         :param msg: message to be processed
+        :param properties: MQTT v5 response properties (reply is not retained when set)
+        :param reply_compression: compression requested by the client
         """
-        auth: typing.Optional[typing.Dict[str, str]] = None
-        if app_info.get("mqtt_credentials", None) and app_info["mqtt_credentials"]:
-            auth = {
-                "username": app_info["mqtt_credentials"][0],
-                "password": app_info["mqtt_credentials"][1],
-            }
-
-        def work():
-            # mark reply_id as working reply
-            with self.working_replies_lock:
-                self.working_replies[reply_id] = (threading.current_thread(), time.monotonic())
-
-            response = MqttListener.router.process_message(msg)
-            raw_response = json.dumps(response)
-            kwargs = dict(
-                payload=raw_response,
-                qos=0,
-                retain=True,
-                hostname=self.host,
-                port=self.port,
-                auth=auth,
-            )
-            logger.debug("Publishing response '%s' to '%s'", response, reply_topic)
-            try:
-                single(reply_topic, **kwargs)
-            except ConnectionRefusedError:
-                # retry in case the connection was interrupted (due to fosquitto restart)
-                logger.warning("Publishing response to '%s' failed (resending)", reply_topic)
-                time.sleep(0.3)
-                try:
-                    single(reply_topic, **kwargs)
-                except ConnectionAbortedError:
-                    logger.error(
-                        "Publishing response to '%s' failed (failed - message not sent))",
-                        reply_topic,
-                    )
-                    raise
-            logger.debug("Reply '%s' published.", reply_id)
 
-            # clear retains
-            time.sleep(CLEAR_RETAIN_PERIOD)
-            logger.debug("Clearing retained messages '%s'", reply_topic)
-            single(
+        with self.pending_lock:
+            pending = self.pending
+            busy = pending >= self.workers + self.queue_size
+            if not busy:
+                self.pending += 1
+
+        if busy:
+            logger.warning("Too many requests pending (%d), rejecting '%s'", pending, reply_id)
+            response = {
+                "module": msg["module"],
+                "kind": "reply",
+                "action": msg["action"],
+                "errors": [{"description": "Controller is busy (too many requests pending)."}],
+            }
+            self.reply_client.publish(
                 reply_topic,
-                payload="",
-                qos=2,
-                retain=True,
-                hostname=self.host,
-                port=self.port,
-                auth=auth,
+                json.dumps(response),
+                qos=1,
+                retain=properties is None,
+                properties=properties,
             )
-            logger.debug("Retained messages '%s' should be cleared", reply_topic)
+            if properties is None:
+                self._schedule_clear(reply_topic, reply_id)
+            return
 
-            # unmark reply_id as working reply
-            with self.working_replies_lock:
-                try:
-                    del self.working_replies[reply_id]
-                except KeyError:
-                    pass
-                # perform a cleanup
-                # (if corresponding thread is not alive and retain period was reached)
-                ids_to_delete = [
-                    k
-                    for k, v in self.working_replies.items()
-                    if not v[0].is_alive() and time.monotonic() - v[1] > CLEAR_RETAIN_PERIOD
-                ]
-                for del_id in ids_to_delete:
-                    del self.working_replies[del_id]
-
-        thread = threading.Thread(target=work, name=f"worker-{reply_id}", daemon=False)
-        thread.start()
+        # mark reply_id as working reply
+        with self.working_replies_lock:
+            self.working_replies[reply_id] = time.monotonic()
+
+        def work():
+            try:
+                response = MqttListener.router.process_message(msg)
+                self._publish_reply(reply_topic, response, properties, reply_compression)
+                logger.debug("Reply '%s' published.", reply_id)
+            except Exception:
+                logger.exception("Failed to process request '%s'", reply_id)
+                with self.working_replies_lock:
+                    self.working_replies.pop(reply_id, None)
+                return
+            finally:
+                with self.pending_lock:
+                    self.pending -= 1
+
+            self._finish_reply(reply_topic, reply_id, properties)
+
+        self.executor.submit(work)
 
     def __init__(self, host: str, port: int):
         self.announcer_thread_running: bool = False
         self.mqtt_client_id: str = f"{uuid.uuid4()}-controller-request"
         self.host: str = host
         self.port: int = port
-        self.working_replies: typing.Set[typing.Dict[str, threading.Thread]] = dict()
+        # reply_id -> time when the request was accepted
+        self.working_replies: typing.Dict[str, float] = dict()
         self.working_replies_lock: threading.Lock = threading.Lock()
 
+        self.workers: int = app_info.get("mqtt_workers") or WORKERS_DEFAULT
+        self.queue_size: int = app_info.get("mqtt_queue_size")
+        if self.queue_size is None:
+            self.queue_size = QUEUE_SIZE_DEFAULT
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="worker")
+        self.pending: int = 0  # requests which are being processed or waiting in the queue
+        self.pending_lock: threading.Lock = threading.Lock()
+
+        self.reply_client: mqtt.Client = self._connect_reply_client()
+
+        self.introspection: IntrospectionResponses = IntrospectionResponses()
+        self.topic_router: TopicRouter = self._prepare_topic_router()
+
+        # clears the retained replies
+        self.scheduler: Scheduler = Scheduler("scheduler", batch_window=CLEAR_RETAIN_BATCH_WINDOW)
+
         def on_publish(client, userdata, mid):
             logger.debug("Mid %s is published", mid)
 
-        def on_subscribe(client, userdata, mid, granted_qos):
+        def on_subscribe(client, userdata, mid, granted_qos, properties=None):
             MqttListener.subscriptions[mid] = True
             logger.debug("Subscribed to %d", mid)
             if not [e for e in MqttListener.subscriptions.values() if not e]:
                 logger.debug("All subscriptions passed.")
+                # modules are loaded at this point, so the responses can be prepared
+                self.introspection.get("list")
                 if not self.announcer_thread_running:
                     logger.debug("Starting announcer thread.")
                     bus_info["bus_thread"] = threading.current_thread()
@@ -377,46 +913,57 @@ class MqttListener(BaseSocketListener):
             except ValueError:
                 logger.warning("Payload is not a JSON (msg.payload='%s')", msg.payload)
                 return  # message in wrong format
+            if not isinstance(parsed, dict):
+                logger.warning("Payload is not a JSON object (msg.payload='%s')", msg.payload)
+                return  # message in wrong format
 
-            if "reply_msg_id" not in parsed:
-                logger.warning("Missing mandatory reply_msg_id (data='%s')", parsed)
-                return  # missing reply msg_id
-            reply_topic = (
-                f"foris-controller/{app_info['controller_id']}/reply/{parsed['reply_msg_id']}"
-            )
-
-            response = None
-
-            # parse topic
-            match = re.match(r"^foris-controller/[^/]+/list$", msg.topic)
-            if match:
-                response = MqttListener.list_modules()
-
-            match = re.match(r"^foris-controller/[^/]+/jsonschemas$", msg.topic)
-            if match:
-                response = MqttListener.get_schema()
+            msg_properties = getattr(msg, "properties", None)
+            response_topic = getattr(msg_properties, "ResponseTopic", None)
+            if response_topic:
+                # MQTT v5 request/response => reply only to the requester (not retained)
+                reply_topic = response_topic
+                properties = Properties(PacketTypes.PUBLISH)
+                correlation_data = getattr(msg_properties, "CorrelationData", None)
+                if correlation_data is not None:
+                    properties.CorrelationData = correlation_data
+                reply_id = parsed.get("reply_msg_id") or (
+                    correlation_data.hex() if correlation_data else str(uuid.uuid4())
+                )
 
-            match = re.match(r"^foris-controller/[^/]+/request/([^/]+)/list$", msg.topic)
-            if match:
-                module_name = match.group(1)
-                response = MqttListener.list_actions(module_name)
+            else:
+                if "reply_msg_id" not in parsed:
+                    logger.warning("Missing mandatory reply_msg_id (data='%s')", parsed)
+                    return  # missing reply msg_id
+                reply_topic = (
+                    f"foris-controller/{app_info['controller_id']}/reply/{parsed['reply_msg_id']}"
+                )
+                properties = None
+                reply_id = parsed["reply_msg_id"]
 
-            match = re.match(r"^foris-controller/[^/]+/working_replies$", msg.topic)
-            if match:
-                response = self.list_working_replies()
+            handler, levels = self.topic_router.match(msg.topic)
+            if not handler:
+                # This should not happen
+                logger.error("Don't know how to respond.")
+                return
 
-            match = re.match(r"^foris-controller/[^/]+/request/([^/]+)/action/([^/]+)$", msg.topic)
-            if match:
-                module_name, action_name = match.group(1, 2)
-                msg = {"module": module_name, "kind": "request", "action": action_name}
-                if "data" in parsed:
-                    msg["data"] = parsed["data"]
-                self.start_message_worker(reply_topic, parsed["reply_msg_id"], msg)
-                return  # reply will be performed elsewhere
+            reply_compression = compression.requested(parsed)
+            response = handler(
+                reply_topic, reply_id, properties, reply_compression, parsed, *levels
+            )
 
             if response is not None:
-                raw_response = json.dumps(response)
-                mqtt_message = client.publish(reply_topic, raw_response, qos=0, retain=True)
+                if isinstance(response, bytes):
+                    raw_response = response
+                else:
+                    raw_response = json.dumps(response).encode("utf8")
+                raw_response = compression.encode(raw_response, reply_compression)
+                mqtt_message = client.publish(
+                    reply_topic,
+                    raw_response,
+                    qos=0,
+                    retain=properties is None,
+                    properties=properties,
+                )
                 logger.debug(
                     "Publishing message (mid=%s) for %s: %s",
                     mqtt_message.mid,
@@ -424,18 +971,14 @@ class MqttListener(BaseSocketListener):
                     response,
                 )
 
-            else:
-                # This should not happen
-                logger.error("Don't know how to respond.")
-
-        self.client = mqtt.Client(client_id=self.mqtt_client_id, clean_session=False)
-        self.client.on_connect = MqttListener.handle_on_connect
+        self.client = _make_client(self.mqtt_client_id)
+        self.client.on_connect = self.handle_on_connect
         self.client.on_message = on_message
         self.client.on_subscribe = on_subscribe
         self.client.on_publish = on_publish
         if app_info["mqtt_credentials"]:
             self.client.username_pw_set(*app_info["mqtt_credentials"])
-        self.client.connect(host, port, keepalive=30)
+        self.client.connect(host, port, keepalive=30, **_connect_kwargs())
 
     def serve_forever(self):
         self.client.loop_forever()
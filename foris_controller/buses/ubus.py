@@ -18,14 +18,22 @@
 #
 
 
+import gc
+import importlib
 import json
 import logging
+import pkgutil
+import time
+import typing
 import ubus
 import prctl
 import signal
 import multiprocessing
 
-from foris_controller.message_router import Router
+from collections import OrderedDict
+
+from foris_controller import compression
+from foris_controller.message_router import Router, output_validation
 from foris_controller.app import app_info
 from foris_controller.utils import get_modules, LOGGER_MAX_LEN
 
@@ -33,23 +41,128 @@ from .base import BaseNotificationSender, BaseSocketListener, get_method_names_f
 
 logger = logging.getLogger(__name__)
 
+REPLY_CHUNK_SIZE_DEFAULT = 512 * 1024  # in characters
+REPLY_SPLIT_DEPTH = 3  # levels of the reply which are serialized by parts
+REPLY_SPLIT_ITEMS = 1024  # items of a list which are serialized at once
+
 
 class RequestStorage(object):
-    """ Storage for multipart requests"""
+    """ Storage for multipart requests
+
+    Parts are joined only when the final part arrives. Requests which exceed the size limits
+    are rejected and incomplete requests are dropped after `EXPIRE_TIMEOUT`.
+    """
+
+    MAX_REQUEST_SIZE = 32 * 1024 * 1024  # in characters
+    MAX_TOTAL_SIZE = 64 * 1024 * 1024  # in characters
+    EXPIRE_TIMEOUT = 120.0  # in seconds
+
+    # request_id -> {"parts": [...], "size": ..., "updated": ..., "rejected": ...}
+    # (ordered by the last update)
+    data: typing.Dict[str, dict] = OrderedDict()
+    total_size = 0
+
+    @staticmethod
+    def _expire(now: float):
+        while RequestStorage.data:
+            request_id, entry = next(iter(RequestStorage.data.items()))
+            if entry["updated"] + RequestStorage.EXPIRE_TIMEOUT > now:
+                break
+            logger.warning("Dropping expired multipart request '%s'.", request_id)
+            RequestStorage._drop(request_id)
 
-    data = {}
+    @staticmethod
+    def _drop(request_id: str) -> typing.Optional[dict]:
+        entry = RequestStorage.data.pop(request_id, None)
+        if entry:
+            RequestStorage.total_size -= entry["size"]
+        return entry
 
     @staticmethod
-    def append(request_id, data):
+    def append(request_id: str, data: str) -> bool:
         """ Appends data into storage
+
+        :returns: False if the request was rejected (exceeded the limits)
         """
-        RequestStorage.data[request_id] = RequestStorage.data.get(request_id, "") + data
+        now = time.monotonic()
+        RequestStorage._expire(now)
+
+        entry = RequestStorage.data.setdefault(
+            request_id, {"parts": [], "size": 0, "updated": now, "rejected": False}
+        )
+        entry["updated"] = now
+        RequestStorage.data.move_to_end(request_id)
+        if entry["rejected"]:
+            return False
+
+        if (
+            entry["size"] + len(data) > RequestStorage.MAX_REQUEST_SIZE
+            or RequestStorage.total_size + len(data) > RequestStorage.MAX_TOTAL_SIZE
+        ):
+            logger.warning("Multipart request '%s' is too large, rejecting.", request_id)
+            # remaining parts of the request are ignored till it expires or its final part arrives
+            RequestStorage.total_size -= entry["size"]
+            entry.update({"parts": [], "size": 0, "rejected": True})
+            return False
+
+        entry["parts"].append(data)
+        entry["size"] += len(data)
+        RequestStorage.total_size += len(data)
+        return True
 
     @staticmethod
-    def pickup(request_id):
+    def pickup(request_id: str) -> typing.Optional[str]:
         """ Reads and removes data from the storage.
+
+        :returns: joined data or None if the request was rejected or expired
         """
-        return RequestStorage.data.pop(request_id)
+        entry = RequestStorage._drop(request_id)
+        if not entry or entry["rejected"]:
+            return None
+        return "".join(entry["parts"])
+
+
+def _encode_pieces(obj: typing.Any, depth: int = REPLY_SPLIT_DEPTH) -> typing.Iterator[str]:
+    """ Serializes the object by parts (the same output as `json.dumps(obj)`)
+
+    `json.JSONEncoder.iterencode()` would use the pure python encoder, which is several times
+    slower than the C encoder used by `json.dumps()`. So only the dicts within the first `depth`
+    levels are split and lists are serialized by `json.dumps()` in batches of
+    `REPLY_SPLIT_ITEMS` items. Replies of a common size are serialized by a few `json.dumps()`
+    calls and large replies are not kept in memory as a whole.
+    """
+    if depth and isinstance(obj, dict) and obj and all(isinstance(k, str) for k in obj):
+        yield "{"
+        for i, (key, value) in enumerate(obj.items()):
+            yield (", " if i else "") + json.dumps(key) + ": "
+            yield from _encode_pieces(value, depth - 1)
+        yield "}"
+    elif depth and isinstance(obj, list) and len(obj) > REPLY_SPLIT_ITEMS:
+        yield "["
+        for i in range(0, len(obj), REPLY_SPLIT_ITEMS):
+            yield (", " if i else "") + json.dumps(obj[i : i + REPLY_SPLIT_ITEMS])[1:-1]
+        yield "]"
+    else:
+        yield json.dumps(obj)
+
+
+def _chunked(pieces: typing.Iterable[str], size: int) -> typing.Iterator[str]:
+    """ Joins the pieces and splits them to chunks which are at most `size` long
+    """
+    buffer: typing.List[str] = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            data = "".join(buffer)
+            end = len(data) - len(data) % size
+            for i in range(0, end, size):
+                yield data[i : i + size]
+            buffer = [data[end:]]
+            buffered = len(buffer[0])
+    if buffered:
+        yield "".join(buffer)
 
 
 def _register_object(module_name, module):
@@ -80,20 +193,22 @@ def _register_object(module_name, module):
 
             # handle multipart message
             if data["multipart"]:
-                RequestStorage.append(data["request_id"], data["payload"]["multipart_data"])
-                logger.debug("Multipart stored for '%s'" % data["request_id"])
+                if RequestStorage.append(data["request_id"], data["payload"]["multipart_data"]):
+                    logger.debug("Multipart stored for '%s'" % data["request_id"])
                 if data["final"]:
                     logger.debug("Parsing multipart data.")
-                    try:
-                        multi_data = RequestStorage.pickup(data["request_id"])
-                        data["data"] = json.loads(multi_data)
-                    except ValueError:
-                        logger.debug("Failed to parse multipart message.")
-                        res = {
-                            "errors": [
-                                {"description": "failed to parse multipart", "stacktrace": ""}
-                            ]
-                        }
+                    multi_data = RequestStorage.pickup(data["request_id"])
+                    error = None
+                    if multi_data is None:
+                        error = "multipart too large or expired"
+                    else:
+                        try:
+                            data["data"] = json.loads(multi_data)
+                        except ValueError:
+                            logger.debug("Failed to parse multipart message.")
+                            error = "failed to parse multipart"
+                    if error:
+                        res = {"errors": [{"description": error, "stacktrace": ""}]}
                         handler.reply({"data": json.dumps(res)})
                         return
                 else:
@@ -101,6 +216,7 @@ def _register_object(module_name, module):
             elif "data" in data["payload"]:
                 data["data"] = data["payload"]["data"]
 
+            reply_compression = compression.requested(data["payload"])
             del data["multipart"]
             del data["final"]
             del data["request_id"]
@@ -111,12 +227,16 @@ def _register_object(module_name, module):
                 dumped_data = {"errors": response["errors"]}
             else:
                 dumped_data = {"data": response["data"]}
-            dumped_data = json.dumps(dumped_data)
 
-            logger.debug("Sending response %s" % str(dumped_data)[:LOGGER_MAX_LEN])
-            for i in range(0, len(dumped_data), 512 * 1024):
-                handler.reply({"data": dumped_data[i : i + 512 * 1024]})
-                logger.debug("Part %d was sent." % (i / (512 * 1024) + 1))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Sending response %s" % str(dumped_data)[:LOGGER_MAX_LEN])
+            # the response is serialized while it is being sent
+            chunk_size = app_info.get("ubus_reply_chunk_size") or REPLY_CHUNK_SIZE_DEFAULT
+            pieces = _chunked(_encode_pieces(dumped_data), chunk_size)
+            pieces = compression.encode_iter(pieces, reply_compression)
+            for i, chunk in enumerate(_chunked(pieces, chunk_size)):
+                handler.reply({"data": chunk})
+                logger.debug("Part %d was sent." % (i + 1))
             logger.debug("Handling finished.")
 
         return handler
@@ -183,6 +303,32 @@ def ubus_all_in_one_worker(socket_path, modules_list):
         ubus.disconnect()
 
 
+def _group_modules(modules: list, processes: int) -> typing.List[list]:
+    """ Splits the modules into groups (each group is handled by a single worker process)
+
+    :param modules: list of (module_name, module)
+    :param processes: number of groups (0 means a group per module)
+    """
+    count = min(processes, len(modules)) if processes > 0 else len(modules)
+    groups: typing.List[list] = [[] for _ in range(count)]
+    for i, record in enumerate(modules):
+        groups[i % count].append(record)
+    return groups
+
+
+def _preload_backends():
+    """ Imports all backends, so they are imported only once before the workers are forked
+    """
+    import foris_controller_backends
+
+    for module_info in pkgutil.iter_modules(foris_controller_backends.__path__):
+        name = f"foris_controller_backends.{module_info.name}"
+        try:
+            importlib.import_module(name)
+        except Exception:
+            logger.warning("Failed to preload backend '%s'.", name, exc_info=True)
+
+
 class UbusListener(BaseSocketListener):
     def __init__(self, socket_path):
         """ Inits object which handle listening on ubus
@@ -193,21 +339,31 @@ class UbusListener(BaseSocketListener):
 
         logger.debug("Starting to create workers for ubus.")
 
+        # counters of the failed validations are read by a different process (introspect)
+        output_validation.make_shared()
+
+        # workers share the memory of this process (copy-on-write) so they have to be forked
+        context = multiprocessing.get_context("fork")
+        modules = get_modules(app_info["filter_modules"], app_info["extra_module_paths"])
+        processes = 1 if app_info["ubus_single_process"] else app_info.get("ubus_processes", 0)
+
         self.workers = []
-        if app_info["ubus_single_process"]:
-            worker = multiprocessing.Process(
-                name="all-in-one",
-                target=ubus_all_in_one_worker,
-                args=(
-                    socket_path,
-                    get_modules(app_info["filter_modules"], app_info["extra_module_paths"]),
-                ),
+        if processes == 1:
+            worker = context.Process(
+                name="all-in-one", target=ubus_all_in_one_worker, args=(socket_path, modules)
             )
             self.workers.append(worker)
+        elif processes > 1:
+            for group in _group_modules(modules, processes):
+                worker = context.Process(
+                    name="+".join(module_name for module_name, _ in group),
+                    target=ubus_all_in_one_worker,
+                    args=(socket_path, group),
+                )
+                self.workers.append(worker)
         else:
-            modules = get_modules(app_info["filter_modules"], app_info["extra_module_paths"])
             for module_name, module in modules:
-                worker = multiprocessing.Process(
+                worker = context.Process(
                     name=module_name,
                     target=ubus_listener_worker,
                     args=(socket_path, module_name, module),
@@ -221,6 +377,14 @@ class UbusListener(BaseSocketListener):
         """
         logger.debug("Starting to run workers.")
 
+        # Import everything before the workers are forked and move the objects to the permanent
+        # generation, so the garbage collector in the workers doesn't touch (and unshare)
+        # the memory pages inherited from this process.
+        if app_info.get("backend") == "openwrt":
+            _preload_backends()  # mock handlers don't use the backends
+        gc.collect()
+        gc.freeze()
+
         for worker in self.workers:
             worker.start()
 
@@ -17,14 +17,17 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 #
 
+import asyncio
 import json
 import logging
 import os
 import socket
 import struct
 
+from concurrent.futures import ThreadPoolExecutor
 from socketserver import BaseRequestHandler, UnixStreamServer, ThreadingMixIn
 
+from foris_controller import compression
 from foris_controller.message_router import Router
 from foris_controller.utils import LOGGER_MAX_LEN
 
@@ -33,6 +36,34 @@ from .base import BaseNotificationSender, BaseSocketListener
 
 logger = logging.getLogger(__name__)
 
+WORKERS_DEFAULT = 4
+PIPELINED_MAX_DEFAULT = 64
+
+# Pipelined frames have this bit set in the length and the length is followed by
+# a request id (4 bytes). The reply is sent in the same kind of frame with the same id
+# as soon as it is ready, so the replies may be sent in a different order than the requests.
+PIPELINED_FLAG = 0x80000000
+
+
+def _pack_header(length, request_id=None):
+    if request_id is None:
+        return struct.pack("I", length)
+    return struct.pack("II", length | PIPELINED_FLAG, request_id)
+
+
+def _wrong_data_response(router, request_id):
+    """ Response to the data which are not a JSON
+
+    Only pipelined requests are replied (the client waits for the reply with the request id).
+
+    :returns: serialized response with the header or None when nothing should be sent
+    """
+    if request_id is None:
+        return None
+    response = router._build_error_msg({}, [{"description": "Wrong data received."}])
+    response = json.dumps(response).encode("utf8")
+    return _pack_header(len(response), request_id) + response
+
 
 class UnixSocketHandler(BaseRequestHandler):
     def setup(self):
@@ -41,6 +72,15 @@ class UnixSocketHandler(BaseRequestHandler):
         logger.debug("Client connected.")
         self.router = Router()
 
+    def _recv_exactly(self, length):
+        data = b""
+        while len(data) < length:
+            chunk = self.request.recv(length - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return data
+
     def handle(self):
         """ Main handler
         """
@@ -54,6 +94,12 @@ class UnixSocketHandler(BaseRequestHandler):
                     break
                 length = struct.unpack("I", length_data)[0]
                 logger.debug("Length received '%s'." % str(length))
+                request_id = None
+                if length & PIPELINED_FLAG:
+                    # requests are processed one by one in this handler
+                    length &= ~PIPELINED_FLAG
+                    request_id = struct.unpack("I", self._recv_exactly(4))[0]
+                    logger.debug("Request id received '%d'." % request_id)
                 received_data = self.request.recv(length)
                 received_data_len = len(received_data)
                 logger.debug("Data recieved len %d", received_data_len)
@@ -67,11 +113,16 @@ class UnixSocketHandler(BaseRequestHandler):
                     parsed = json.loads(received_data.decode("utf8"))
                 except ValueError:
                     logger.warning("Wrong data received.")
+                    response = _wrong_data_response(self.router, request_id)
+                    if response:
+                        self.request.sendall(response)
                     continue
 
+                reply_compression = compression.requested(parsed)
                 response = self.router.process_message(parsed)
                 response = json.dumps(response).encode("utf8")
-                response_length = struct.pack("I", len(response))
+                response = compression.encode(response, reply_compression)
+                response_length = _pack_header(len(response), request_id)
                 logger.debug(
                     "Sending response (len=%d) %s" % (len(response), str(response)[:LOGGER_MAX_LEN])
                 )
@@ -105,6 +156,128 @@ class UnixSocketListener(ThreadingMixIn, UnixStreamServer, BaseSocketListener):
         UnixStreamServer.__init__(self, socket_path, UnixSocketHandler)
 
 
+class AsyncUnixSocketListener(BaseSocketListener):
+    def __init__(self, socket_path, workers=WORKERS_DEFAULT, pipelined_max=PIPELINED_MAX_DEFAULT):
+        """ Init asyncio based listener
+
+        Connections are handled within a single event loop thread,
+        messages are processed by a bounded pool of worker threads.
+
+        :param socket_path: path to unix socket
+        :type socket_path: str
+        :param workers: number of threads which process the messages
+        :type workers: int
+        :param pipelined_max: max number of pipelined requests processed per connection
+                              (reading from the connection is paused when reached)
+        :type pipelined_max: int
+        """
+
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+
+        self.socket_path = socket_path
+        self.pipelined_max = pipelined_max
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="unix-socket")
+        self.router = Router()
+
+    async def _read_message(self, reader):
+        """ Reads a single length-prefixed message
+
+        :returns: (request id or None, message data) or None when the connection was closed
+        :rtype: tuple
+        """
+        try:
+            length_data = await reader.readexactly(4)
+            length = struct.unpack("I", length_data)[0]
+            logger.debug("Length received '%s'." % str(length))
+            request_id = None
+            if length & PIPELINED_FLAG:
+                length &= ~PIPELINED_FLAG
+                request_id = struct.unpack("I", await reader.readexactly(4))[0]
+                logger.debug("Request id received '%d'." % request_id)
+            return request_id, await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            return None
+
+    async def _process_message(self, writer, write_lock, request_id, received_data):
+        logger.debug("Data received '%s'." % str(received_data)[:LOGGER_MAX_LEN])
+        try:
+            parsed = json.loads(received_data.decode("utf8"))
+        except ValueError:
+            logger.warning("Wrong data received.")
+            response = _wrong_data_response(self.router, request_id)
+            if response:
+                async with write_lock:
+                    writer.write(response)
+                    await writer.drain()
+            return
+
+        reply_compression = compression.requested(parsed)
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(self.executor, self.router.process_message, parsed)
+        response = json.dumps(response).encode("utf8")
+        response = compression.encode(response, reply_compression)
+        logger.debug(
+            "Sending response (len=%d) %s" % (len(response), str(response)[:LOGGER_MAX_LEN])
+        )
+        async with write_lock:
+            writer.write(_pack_header(len(response), request_id) + response)
+            await writer.drain()
+
+    async def _handle_connection(self, reader, writer):
+        logger.debug("Client connected.")
+        write_lock = asyncio.Lock()
+        pipelined = asyncio.Semaphore(self.pipelined_max)
+        pending = set()
+
+        async def process_pipelined(request_id, received_data):
+            try:
+                await self._process_message(writer, write_lock, request_id, received_data)
+            finally:
+                pipelined.release()
+
+        try:
+            while True:
+                message = await self._read_message(reader)
+                if message is None:
+                    logger.debug("Connection closed.")
+                    break
+
+                request_id, received_data = message
+                if request_id is None:
+                    await self._process_message(writer, write_lock, None, received_data)
+                else:
+                    await pipelined.acquire()
+                    task = asyncio.ensure_future(process_pipelined(request_id, received_data))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+
+            # client might have closed only its write side, so finish the pending requests
+            if pending:
+                await asyncio.gather(*pending)
+
+        except Exception:
+            logger.debug("Connection closed.")
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+            logger.debug("Client diconnected.")
+
+    async def _serve(self):
+        server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        async with server:
+            await server.serve_forever()
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self.executor.shutdown(wait=False)
+
+
 class UnixSocketNotificationSender(BaseNotificationSender):
     def __init__(self, socket_path):
         """ Inits object which handles sending notification via unix-socket
@@ -0,0 +1,113 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright 2023, CZ.NIC z.s.p.o. (https://www.nic.cz/)
+
+""" Optional compression of replies
+
+A client which wants to obtain compressed replies sets `"compression": "zlib"` in the envelope
+of the request. Replies which are larger than `THRESHOLD` are then sent as::
+
+    {"compression": "zlib", "payload": "<base64 encoded zlib compressed reply>"}
+
+Smaller replies (and the replies which wouldn't get smaller) are sent as they are.
+"""
+
+import base64
+import itertools
+import json
+import logging
+import typing
+import zlib
+
+logger = logging.getLogger(__name__)
+
+KEY = "compression"
+SUPPORTED = ("zlib",)
+THRESHOLD = 4096  # in bytes
+
+
+def requested(envelope: dict) -> typing.Optional[str]:
+    """ Removes the compression flag from the envelope of the request
+
+    :returns: compression which should be used for the reply or None
+    """
+    if not isinstance(envelope, dict):
+        return None
+    compression = envelope.pop(KEY, None)
+    if compression is None:
+        return None
+    if compression not in SUPPORTED:
+        logger.warning("Unsupported compression '%s' requested.", compression)
+        return None
+    return compression
+
+
+def encode(raw: bytes, compression: typing.Optional[str]) -> bytes:
+    """ Compresses the serialized reply if it was requested and it is worth it
+
+    :param raw: serialized reply
+    :param compression: compression requested by the client (see `requested()`)
+    :returns: serialized reply or its compressed form
+    """
+    if compression is None or len(raw) < THRESHOLD:
+        return raw
+
+    payload = base64.b64encode(zlib.compress(raw)).decode("ascii")
+    encoded = json.dumps({KEY: compression, "payload": payload}).encode("utf8")
+    if len(encoded) >= len(raw):
+        return raw
+    logger.debug("Reply compressed (%d -> %d bytes).", len(raw), len(encoded))
+    return encoded
+
+
+def encode_iter(
+    pieces: typing.Iterable[str], compression: typing.Optional[str]
+) -> typing.Iterator[str]:
+    """ Streaming variant of `encode()`
+
+    The reply is compressed whenever it is larger than `THRESHOLD`
+    (it is not known in advance whether the compressed reply would be smaller).
+
+    :param pieces: parts of the serialized reply (e.g. from `json.JSONEncoder.iterencode()`)
+    :param compression: compression requested by the client (see `requested()`)
+    :returns: parts of the serialized reply or its compressed form
+    """
+    if compression is None:
+        yield from pieces
+        return
+
+    pieces = iter(pieces)
+    head = []
+    size = 0
+    for piece in pieces:
+        head.append(piece)
+        size += len(piece)
+        if size >= THRESHOLD:
+            break
+    else:
+        yield "".join(head)
+        return
+
+    compressor = zlib.compressobj()
+    pending = b""
+    # the envelope without the closing quote of the payload and the closing brace
+    yield json.dumps({KEY: compression, "payload": ""})[:-2]
+    for piece in itertools.chain(head, pieces):
+        pending += compressor.compress(piece.encode("utf8"))
+        # base64 encodes 3 bytes at once
+        cut = len(pending) - len(pending) % 3
+        if cut:
+            yield base64.b64encode(pending[:cut]).decode("ascii")
+            pending = pending[cut:]
+    yield base64.b64encode(pending + compressor.flush()).decode("ascii")
+    yield '"}'
+
+
+def decode(raw: bytes) -> typing.Any:
+    """ Parses the reply which might be compressed (useful for clients)
+    """
+    parsed = json.loads(raw)
+    if isinstance(parsed, dict) and parsed.keys() == {KEY, "payload"}:
+        if parsed[KEY] != "zlib":
+            raise ValueError(f"Unsupported compression '{parsed[KEY]}'")
+        parsed = json.loads(zlib.decompress(base64.b64decode(parsed["payload"])))
+    return parsed
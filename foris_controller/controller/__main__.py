@@ -33,6 +33,7 @@ from foris_controller.app import (
     prepare_app_modules,
     prepare_notification_sender,
 )
+from foris_controller.message_router import OutputValidation
 from foris_controller.utils import LOGGER_MAX_LEN, read_passwd_file
 
 try:
@@ -70,6 +71,18 @@ except ModuleNotFoundError:
 logger = logging.getLogger("foris_controller")
 
 
+def validation_rate(value: str) -> float:
+    """ Parses ratio of the validated replies (0 - 1)
+    """
+    try:
+        rate = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid float value: '{value}'")
+    if not 0.0 <= rate <= 1.0:
+        raise argparse.ArgumentTypeError(f"{value} is not in range 0 - 1")
+    return rate
+
+
 def main():
     global zeroconf
 
@@ -80,13 +93,30 @@ def main():
     subparsers = parser.add_subparsers(help="buses", dest="bus")
     subparsers.required = True
 
+    from foris_controller.buses.unix_socket import WORKERS_DEFAULT
+
     unix_parser = subparsers.add_parser("unix-socket", help="use unix socket to recieve commands")
     unix_parser.add_argument("--path", default="/tmp/foris-controller.soc")
     unix_parser.add_argument(
         "--notifications-path", default="/tmp/foris-controller-notifications.soc"
     )
+    unix_parser.add_argument(
+        "--async",
+        dest="async_listener",
+        default=False,
+        action="store_true",
+        help="handle connections using asyncio (messages are processed by a pool of workers)",
+    )
+    unix_parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS_DEFAULT,
+        help="number of workers which process the messages (only with --async)",
+    )
 
     if "ubus" in available_buses:
+        from foris_controller.buses.ubus import REPLY_CHUNK_SIZE_DEFAULT
+
         ubus_parser = subparsers.add_parser("ubus", help="use ubus to recieve commands")
         ubus_parser.add_argument("--path", default="/var/run/ubus.sock")
         ubus_parser.add_argument(
@@ -95,9 +125,28 @@ def main():
             action="store_true",
             help="run only through a single worker process",
         )
+        ubus_parser.add_argument(
+            "--processes",
+            dest="ubus_processes",
+            type=int,
+            default=0,
+            help="number of worker processes which handle the modules "
+            "(modules are split among them, 0 means a process per module)",
+        )
+        ubus_parser.add_argument(
+            "--reply-chunk-size",
+            type=int,
+            default=REPLY_CHUNK_SIZE_DEFAULT,
+            help="max size of a single part of the reply (in characters)",
+        )
 
     if "mqtt" in available_buses:
-        from foris_controller.buses.mqtt import ANNOUNCER_PERIOD_DEFAULT
+        from foris_controller.buses.mqtt import (
+            ANNOUNCER_HEARTBEAT_DEFAULT,
+            ANNOUNCER_PERIOD_DEFAULT,
+            QUEUE_SIZE_DEFAULT,
+            WORKERS_DEFAULT as MQTT_WORKERS_DEFAULT,
+        )
 
         mqtt_parser = subparsers.add_parser("mqtt", help="use mqtt recieve commands")
         mqtt_parser.add_argument("--host", default="127.0.0.1")
@@ -120,6 +169,35 @@ def main():
             "(in seconds, when set to 0 no announcments will be sent)",
             default=os.environ.get("FC_MQTT_ANNOUNCER_PERIOD", ANNOUNCER_PERIOD_DEFAULT),
         )
+        mqtt_parser.add_argument(
+            "--announcer-heartbeat",
+            type=float,
+            help="Configures how often will be the same advertizement broadcasted again "
+            "(in seconds, changed advertizement is broadcasted right away)",
+            default=os.environ.get("FC_MQTT_ANNOUNCER_HEARTBEAT", ANNOUNCER_HEARTBEAT_DEFAULT),
+        )
+        mqtt_parser.add_argument(
+            "--protocol-v5",
+            dest="mqtt_v5",
+            action="store_true",
+            default=False,
+            help="use MQTT v5 (requests with a response topic get replies which are not retained)",
+        )
+        mqtt_parser.add_argument(
+            "--workers",
+            dest="mqtt_workers",
+            type=int,
+            help="number of threads which process the requests",
+            default=MQTT_WORKERS_DEFAULT,
+        )
+        mqtt_parser.add_argument(
+            "--queue-size",
+            dest="mqtt_queue_size",
+            type=int,
+            help="max number of requests waiting for a free worker "
+            "(requests over this limit are rejected with a busy error)",
+            default=QUEUE_SIZE_DEFAULT,
+        )
         if zeroconf:
             mqtt_parser.add_argument(
                 "--zeroconf-enabled",
@@ -168,6 +246,25 @@ def main():
         help="set extra path to module (e.g. /path/module_name)",
         required=False,
     )
+    parser.add_argument(
+        "--capability-cache-ttl",
+        type=float,
+        help="how long will be hardware capabilities (interfaces, wifi bands) cached "
+        "(in seconds, when set to 0 the caching is disabled)",
+        default=os.environ.get("FC_CAPABILITY_CACHE_TTL", None),
+    )
+    parser.add_argument(
+        "--validate-output",
+        choices=OutputValidation.POLICIES,
+        help="whether the replies are validated (sampled - only some of them are validated)",
+        default=os.environ.get("FC_VALIDATE_OUTPUT", "always"),
+    )
+    parser.add_argument(
+        "--validate-output-rate",
+        type=validation_rate,
+        help="ratio of the replies which are validated when --validate-output=sampled",
+        default=os.environ.get("FC_VALIDATE_OUTPUT_RATE", OutputValidation.RATE_DEFAULT),
+    )
     if client_modules_loaded:
         parser.add_argument(
             "-C",
@@ -178,6 +275,12 @@ def main():
         )
 
     options = parser.parse_args()
+    if options.validate_output not in OutputValidation.POLICIES:
+        # default is read from env and argparse doesn't check it
+        parser.error(
+            f"argument --validate-output: invalid choice: '{options.validate_output}' "
+            f"(choose from {', '.join(OutputValidation.POLICIES)})"
+        )
 
     # Store app info
     set_app_info(options)
@@ -208,12 +311,16 @@ def main():
 
     elif options.bus == "unix-socket":
         from foris_controller.buses.unix_socket import (
+            AsyncUnixSocketListener,
             UnixSocketListener,
             UnixSocketNotificationSender,
         )
 
         logger.info("Using unix-socket to recieve commands.")
-        server = UnixSocketListener(options.path)
+        if options.async_listener:
+            server = AsyncUnixSocketListener(options.path, options.workers)
+        else:
+            server = UnixSocketListener(options.path)
         prepare_notification_sender(UnixSocketNotificationSender, options.notifications_path)
     elif options.bus == "mqtt":
         from foris_controller.buses.mqtt import MqttListener, MqttNotificationSender
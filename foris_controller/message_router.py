@@ -18,14 +18,20 @@
 #
 
 import logging
+import random
+import threading
 import time
+import typing
 
 from traceback import format_exc
 
 from jsonschema import ValidationError
 from functools import wraps
 
+from foris_controller.action_validators import action_validators
 from foris_controller.app import app_info
+from foris_controller.request_context import request_context
+from foris_controller.utils import make_multiprocessing_manager
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +53,67 @@ def display_spend_time(message_in, message_out):
     return real_decorator
 
 
+class OutputValidation:
+    """ Decides whether the replies are validated and counts the replies which failed
+
+    Policy is set by `app_info["validate_output"]`:
+        always - all replies are validated
+        sampled - replies are validated with `app_info["validate_output_rate"]` probability
+        off - replies are not validated
+    """
+
+    POLICIES = ("always", "sampled", "off")
+    RATE_DEFAULT = 0.1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures: typing.Dict[typing.Tuple[str, str], int] = {}  # (module, action) -> count
+
+    @property
+    def policy(self) -> str:
+        return app_info.get("validate_output") or "always"
+
+    @property
+    def rate(self) -> float:
+        rate = app_info.get("validate_output_rate")
+        return self.RATE_DEFAULT if rate is None else rate
+
+    def make_shared(self):
+        """ Makes the counters shared by the processes forked afterwards
+        """
+        manager = make_multiprocessing_manager()
+        self._lock = manager.Lock()
+        self._failures = manager.dict()
+
+    def should_validate(self) -> bool:
+        policy = self.policy
+        if policy == "off":
+            return False
+        if policy == "sampled":
+            return random.random() < self.rate
+        return True
+
+    def record_failure(self, module: str, action: str):
+        key = (module, action)
+        with self._lock:
+            self._failures[key] = self._failures.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            failures = dict(self._failures)
+        return {
+            "policy": self.policy,
+            "rate": self.rate,
+            "failures": [
+                {"module": module, "action": action, "count": count}
+                for (module, action), count in sorted(failures.items())
+            ],
+        }
+
+
+output_validation = OutputValidation()
+
+
 class Router(object):
     def _build_error_msg(self, orig_msg, errors):
         """ prepare error response
@@ -73,7 +140,7 @@ class Router(object):
         :type message: dict
         """
 
-        app_info["validator"].validate(message)
+        action_validators.validate(message)
 
     @display_spend_time("Starting to process message", "Message processing took %f.")
     def process_message(self, message):
@@ -114,7 +181,9 @@ class Router(object):
 
         module_instance = app_info["modules"][message["module"]]
         try:
-            data = module_instance.perform_action(message["action"], message.get("data", {}))
+            # data read by backends are memoized until the request is processed
+            with request_context():
+                data = module_instance.perform_action(message["action"], message.get("data", {}))
         except Exception as e:
             logger.error("Internal error occured %s('%s'):" % (type(e), str(e)))
             logger.debug(format_exc())
@@ -135,12 +204,17 @@ class Router(object):
             "data": data,
         }
 
+        if not output_validation.should_validate():
+            logger.debug("Output message validation skipped.")
+            return reply
+
         logger.debug("Starting to validate output message.")
         try:
             self.validate(reply)
         except ValidationError as exc:
             logger.error("Failed to validate output message.")
             logger.debug("Error: \n%s" % str(exc))
+            output_validation.record_failure(message["module"], message["action"])
             return self._build_error_msg(
                 message,
                 [{"description": "Incorrect output. %s" % str(reply), "stacktrace": format_exc()}],
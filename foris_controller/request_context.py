@@ -0,0 +1,64 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright 2023, CZ.NIC z.s.p.o. (https://www.nic.cz/)
+
+""" Data which are valid during processing of a single request
+
+Backends can use `memoize()` to avoid reading the same data (uci configs, files, hardware info)
+several times while a single request is being processed. Outside of the `request_context()`
+nothing is memoized.
+"""
+
+import copy
+import logging
+import threading
+import typing
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+@contextmanager
+def request_context():
+    """ Starts a new context where the memoized data are kept (nested contexts are independent)
+    """
+    previous = getattr(_local, "data", None)
+    _local.data = {}
+    try:
+        yield
+    finally:
+        _local.data = previous
+
+
+def memoize(
+    key: typing.Tuple[typing.Hashable, ...],
+    factory: typing.Callable[[], typing.Any],
+    copy_func: typing.Callable[[typing.Any], typing.Any] = copy.deepcopy,
+) -> typing.Any:
+    """ Returns the data memoized in the current request context or calls the factory
+
+    :param key: identifies the data
+    :param factory: obtains the data (exceptions are propagated and nothing is memoized)
+    :param copy_func: creates a copy of the memoized data for the caller
+    """
+    data = getattr(_local, "data", None)
+    if data is None:
+        return factory()
+
+    if key not in data:
+        data[key] = factory()
+    else:
+        logger.debug("Using data memoized in request context %s", key)
+    return copy_func(data[key])
+
+
+def invalidate(*prefix: typing.Hashable):
+    """ Drops memoized data which keys start with the prefix (all data when prefix is empty)
+    """
+    data = getattr(_local, "data", None)
+    if not data:
+        return
+
+    for key in [e for e in data if e[: len(prefix)] == prefix]:
+        del data[key]
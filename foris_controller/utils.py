@@ -17,6 +17,7 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
 #
 
+import copy
 import imp
 import importlib
 import inspect
@@ -25,7 +26,10 @@ import os
 import pkgutil
 import re
 import signal
+import threading
+import time
 import typing
+import weakref
 from functools import wraps
 from multiprocessing.managers import SyncManager
 
@@ -99,6 +103,61 @@ class RWLock(object):
         self.writelock = RWLock.WriteLock(self)
 
 
+class TTLCache(object):
+    """ Cache for data which change rarely (e.g. hardware capabilities)
+
+    Cached values expire after `ttl` seconds (`TTLCache.default_ttl` is used when `ttl` is not set
+    and 0 disables the caching). Returned values are copies, so they can be modified by the caller.
+    """
+
+    default_ttl = 60.0
+    _instances = weakref.WeakSet()
+
+    def __init__(self, ttl: typing.Optional[float] = None):
+        self.ttl = ttl
+        self._data = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        TTLCache._instances.add(self)
+
+    def get(self, key: typing.Hashable, factory: typing.Callable[[], typing.Any]) -> typing.Any:
+        """ Returns cached value or calls the factory to obtain it
+
+        Value None returned by the factory is not cached (it is considered to be a failure).
+        """
+        ttl = TTLCache.default_ttl if self.ttl is None else self.ttl
+        with self._lock:
+            cached = self._data.get(key)
+            if cached and cached[0] > time.monotonic():
+                return copy.deepcopy(cached[1])
+            generation = self._generation
+
+        expires = time.monotonic() + ttl
+        value = factory()
+        with self._lock:
+            # don't store the value when the cache was invalidated meanwhile
+            if ttl > 0 and value is not None and generation == self._generation:
+                self._data[key] = (expires, value)
+        return copy.deepcopy(value)
+
+    def invalidate(self, key: typing.Optional[typing.Hashable] = None):
+        """ Drops the cached value of the key (all values when the key is not set)
+        """
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+            self._generation += 1
+
+    @staticmethod
+    def invalidate_all():
+        """ Drops the values of all caches (e.g. when the network is restarted)
+        """
+        for cache in list(TTLCache._instances):
+            cache.invalidate()
+
+
 def logger_wrapper(logger):
     """ Wraps funcion with some debug outputs of the logger
 
@@ -20,6 +20,7 @@
 import logging
 import typing
 
+from foris_controller import request_context
 from foris_controller.app import app_info
 from foris_controller.exceptions import FailedToParseFileContent
 from foris_controller.updater import svupdater_branch
@@ -59,6 +60,14 @@ class SystemInfoFiles(BaseFile):
     CMDLINE_PATH = "/proc/cmdline"
     file_lock = RWLock(app_info["lock_backend"])
 
+    def _read_and_parse(self, path, regex, groups=(1,), log_error=True):
+        """ Content of these files doesn't change, so it is memoized in the request context
+        """
+        return request_context.memoize(
+            ("system_info", path, regex, groups),
+            lambda: super(SystemInfoFiles, self)._read_and_parse(path, regex, groups, log_error),
+        )
+
     @readlock(file_lock, logger)
     def get_os_version(self):
         """ Returns turris os version
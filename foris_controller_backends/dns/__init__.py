@@ -28,6 +28,7 @@ from foris_controller.app import app_info
 from foris_controller.utils import RWLock
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_anonymous,
     get_option_named,
     parse_bool,
@@ -222,7 +223,7 @@ ca_file="/etc/ssl/certs/ca-certificates.crt"
 class DnsUciCommands(object):
     def get_settings(self):
 
-        with UciBackend() as backend:
+        with UciReader() as backend:
             resolver_data = backend.read("resolver")
             dhcp_data = backend.read("dhcp")
 
@@ -25,6 +25,7 @@ from foris_controller_backends.maintain import MaintainCommands
 from foris_controller_backends.services import OpenwrtServices
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_named,
     parse_bool,
     store_bool,
@@ -335,7 +336,7 @@ class GuestUci:
 
     def get_settings(self):
 
-        with UciBackend() as backend:
+        with UciReader() as backend:
             firewall = backend.read("firewall")
             network = backend.read("network")
             sqm = backend.read("sqm")
@@ -32,6 +32,7 @@ from foris_controller_backends.services import OpenwrtServices
 from foris_controller_backends.ubus import UbusBackend
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_named,
     get_sections_by_type,
     parse_bool,
@@ -280,7 +281,7 @@ class LanUci:
 
     def get_settings(self):
 
-        with UciBackend() as backend:
+        with UciReader() as backend:
             network_data = backend.read("network")
             sqm_data = backend.read("sqm")
             dhcp_data = backend.read("dhcp")
@@ -420,7 +421,7 @@ class LanUci:
         :type qos: dict
         """
 
-        with UciBackend() as backend:
+        with UciBackend(batch=True) as backend:
 
             backend.add_section("network", "interface", "lan")
             backend.set_option("network", "lan", "_turris_mode", mode)
@@ -502,10 +503,9 @@ class LanUci:
                     pass  # no need to handle
 
             if qos:
-                try:
-                    backend.del_section("sqm", "limit_lan_turris")
-                except UciException:
-                    pass
+                # errors of the changes above are raised here (batch mode)
+                backend.flush()
+                backend.del_section("sqm", "limit_lan_turris", fail_on_error=False)
 
                 if qos["enabled"]:
                     try:
@@ -522,6 +522,7 @@ class LanUci:
                         # "download" means dowload from the guest network
                         backend.set_option("sqm", "limit_lan_turris", "upload", qos["download"])
                         backend.set_option("sqm", "limit_lan_turris", "download", qos["upload"])
+                        backend.flush()
                     except UciException as e:
                         logger.error("Unable to create sqm record for LAN")
                         raise UciException from e
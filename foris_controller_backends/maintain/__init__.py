@@ -21,6 +21,7 @@ import logging
 import os
 
 from foris_controller.updater import svupdater, svupdater_exceptions
+from foris_controller.utils import TTLCache
 from foris_controller_backends.cmdline import BackendCommandFailed, BaseCmdLine
 
 
@@ -34,6 +35,8 @@ class MaintainCommands(BaseCmdLine):
         self._run_command_in_background("/usr/bin/maintain-reboot")
 
     def restart_network(self):
+        # interfaces might be added or removed during the restart
+        TTLCache.invalidate_all()
         self._run_command_in_background("/usr/bin/maintain-network-restart")
 
     def restart_lighttpd(self):
@@ -25,14 +25,16 @@ from functools import wraps
 
 import turrishw
 
+from foris_controller import request_context
 from foris_controller.exceptions import UciException, UciRecordNotFound
-from foris_controller.utils import sort_by_natural_order
+from foris_controller.utils import TTLCache, sort_by_natural_order
 from foris_controller_backends.about import SystemInfoFiles
 from foris_controller_backends.cmdline import BaseCmdLine
 from foris_controller_backends.guest import GuestUci
 from foris_controller_backends.maintain import MaintainCommands
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_named,
     get_sections_by_type,
     parse_bool,
@@ -45,6 +47,23 @@ logger = logging.getLogger(__name__)
 
 NetworkAndSSIDs = typing.List[typing.Tuple[str, str]]
 
+ifaces_cache = TTLCache()
+
+
+def get_ifaces(cached: bool = False) -> dict:
+    """ Interfaces detected by turrishw
+
+    :param cached: use interfaces cached by `TTLCache` (only the static attributes such as
+                   type, bus, slot, module_id and macaddr can be used then, state and link_speed
+                   might be outdated)
+    """
+    if cached:
+        return request_context.memoize(
+            ("turrishw", "ifaces", "cached"),
+            lambda: ifaces_cache.get("ifaces", turrishw.get_ifaces),
+        )
+    return request_context.memoize(("turrishw", "ifaces"), turrishw.get_ifaces)
+
 
 def decorate_guest_net(pos):
     """Handle guest net on position"""
@@ -263,7 +282,7 @@ class NetworksUci():
         res = []
         res_wireless = []
 
-        interfaces = turrishw.get_ifaces()
+        interfaces = get_ifaces()
         logger.debug("interfaces from turrishw: %s", interfaces)
         try:
             for k, v in interfaces.items():
@@ -313,9 +332,9 @@ class NetworksUci():
 
         try:
             if up_only:
-                hw_interfaces = [k for k, v in turrishw.get_ifaces().items() if v["state"] == "up"]
+                hw_interfaces = [k for k, v in get_ifaces().items() if v["state"] == "up"]
             else:
-                hw_interfaces = [e for e in turrishw.get_ifaces().keys()]
+                hw_interfaces = [e for e in get_ifaces().keys()]
         except Exception:
             hw_interfaces = []
         if get_option_named(network_data, "network", network_name, "ifname", "") != "":
@@ -369,7 +388,7 @@ class NetworksUci():
         ifaces, wifi_ifaces = self.detect_interfaces()
         iface_map = {e["id"]: e for e in typing.cast(typing.Iterable[dict],ifaces)}
 
-        with UciBackend() as backend:
+        with UciReader() as backend:
             network_data = backend.read("network")
             firewall_data = backend.read("firewall")
             try:
@@ -591,7 +610,7 @@ class NetworksWanUci():
         * (wan, wan6) => wired wan
         * (wwan0) => wireless wan
         """
-        with UciBackend() as backend:
+        with UciReader() as backend:
             firewall_data = backend.read("firewall")
 
         wan_zone_cfg_name = NetworksWanUci._get_uci_firewall_wan_zone_section_name(firewall_data)
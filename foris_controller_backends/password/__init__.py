@@ -24,6 +24,7 @@ import pathlib
 from foris_controller_backends.cmdline import BaseCmdLine, BackendCommandFailed
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_named,
     UciException,
     UciRecordNotFound,
@@ -85,7 +86,7 @@ class ForisPasswordUci(object):
         return {"result": True}
 
     def check_password(self, password):
-        with UciBackend() as backend:
+        with UciReader() as backend:
             foris_data = backend.read("foris")
 
         # This could raise UciRecordNotFound which should be caught elsewhere
@@ -33,6 +33,7 @@ from foris_controller_backends.cmdline import AsyncCommand, BaseCmdLine
 from foris_controller_backends.files import BaseFile, path_exists, makedirs
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_named,
     parse_bool,
     UciException,
@@ -163,7 +164,7 @@ class RemoteUci(object):
     DEFAULTS = {"enabled": False, "wan_access": False, "port": 11883}
 
     def get_settings(self):
-        with UciBackend() as backend:
+        with UciReader() as backend:
             fosquitto_data = backend.read("fosquitto")
             firewall_data = backend.read("firewall")
 
@@ -277,7 +278,7 @@ class RemoteFiles(BaseFile):
                 return network_info["ipv4"]
 
         # from uci
-        with UciBackend() as backend:
+        with UciReader() as backend:
             network_data = backend.read("network")
             system_data = backend.read("system")
             fosquitto_data = backend.read("fosquitto")
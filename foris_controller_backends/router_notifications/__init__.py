@@ -26,6 +26,7 @@ from foris_controller.exceptions import FailedToParseCommandOutput
 from foris_controller_backends.cmdline import BaseCmdLine
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_named,
     parse_bool,
     store_bool,
@@ -102,7 +103,7 @@ class RouterNotificationsCmds(BaseCmdLine):
 
 class RouterNotificationsUci(object):
     def get_settings(self):
-        with UciBackend() as backend:
+        with UciReader() as backend:
             data = backend.read("user_notify")
 
         res = {
@@ -20,6 +20,7 @@
 
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_anonymous
 )
 
@@ -30,7 +31,7 @@ class SystemUciCommands:
     def get_hostname() -> str:
         """ Get hostname uci setting. """
 
-        with UciBackend() as backend:
+        with UciReader() as backend:
             system_data = backend.read("system")
 
         hostname = get_option_anonymous(system_data, "system", "system", 0, "hostname", "turris")
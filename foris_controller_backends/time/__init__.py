@@ -26,6 +26,7 @@ from turris_timezone import TZ_GNU
 from foris_controller.app import app_info
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_anonymous,
     get_option_named,
     parse_bool,
@@ -73,7 +74,7 @@ class TimeUciCommands(BaseFile):
 
     def get_settings(self):
 
-        with UciBackend() as backend:
+        with UciReader() as backend:
             system_data = backend.read("system")
 
         timezone = get_option_anonymous(system_data, "system", "system", 0, "timezone")
@@ -196,7 +197,7 @@ class TimeAsyncCmds(AsyncCommand):
             logger.debug("ntpd finished: (retval=%d)" % process_data.get_retval())
 
         # get all ntpserver
-        with UciBackend() as backend:
+        with UciReader() as backend:
             system_data = backend.read("system")
 
         servers = get_option_named(system_data, "system", "ntp", "server", [])
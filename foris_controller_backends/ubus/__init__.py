@@ -16,31 +16,140 @@ import prctl
 
 from foris_controller.app import app_info
 from foris_controller.utils import RWLock, make_multiprocessing_manager
-from foris_controller_backends.cmdline import BaseCmdLine, AsyncProcessData, inject_cmdline_root
+from foris_controller_backends.cmdline import (
+    CMDLINE_ROOT,
+    BaseCmdLine,
+    AsyncProcessData,
+    inject_cmdline_root,
+)
+
+try:
+    import ubus
+except ImportError:
+    ubus = None
 
 logger = logging.getLogger(__name__)
 
 
+class UbusConnection:
+    """Persistent connection to ubus using the python `ubus` binding.
+
+    The binding keeps a single connection per process, so calls from different threads
+    are serialized using a lock. Connection is (re)established lazily and it is dropped
+    when the process is forked (the child has to connect on its own).
+
+    A connection which was created elsewhere in the process (e.g. by ubus bus listener)
+    is never used. Its owner calls the binding outside of the lock (`ubus.loop()`) and the
+    backend calls would be made from within its callbacks, so these calls are left
+    to the ubus executable.
+    """
+
+    def __init__(self, socket_path: typing.Optional[str] = None):
+        self.socket_path = socket_path
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _connected_here(self) -> bool:
+        return self._pid == os.getpid() and ubus.get_connected()
+
+    def available(self) -> bool:
+        """Python ubus binding is used only when it is installed, the cmdline is not mocked
+        and the binding is not connected by someone else
+        """
+        if ubus is None or CMDLINE_ROOT:
+            return False
+        return self._connected_here() or not ubus.get_connected()
+
+    def _connect(self) -> bool:
+        """
+        :returns: False when the binding is connected by someone else
+        """
+        if self._connected_here():
+            return True
+
+        if ubus.get_connected():
+            return False
+
+        logger.debug("Connecting to ubus.")
+        if self.socket_path:
+            ubus.connect(self.socket_path)
+        else:
+            ubus.connect()
+        self._pid = os.getpid()
+        return True
+
+    def call(
+        self, ubus_object: str, method: str, data: dict, timeout: typing.Optional[float] = None
+    ) -> dict:
+        """Call ubus method and return its (first) response
+
+        :raises: RuntimeError when the call fails or the connection can't be used
+        """
+        with self._lock:
+            if not self._connect():
+                raise RuntimeError("ubus connection is owned by someone else")
+            try:
+                if timeout is None:
+                    responses = ubus.call(ubus_object, method, data)
+                else:
+                    responses = ubus.call(ubus_object, method, data, timeout=int(timeout * 1000))
+            except RuntimeError:
+                # connection might be broken (e.g. ubusd restarted) so reconnect next time
+                self.disconnect()
+                raise
+        return responses[0] if responses else {}
+
+    def disconnect(self):
+        if self._connected_here():
+            ubus.disconnect()
+        self._pid = None
+
+
 class UbusBackend(BaseCmdLine):
     UBUS_CMD = "/bin/ubus"
 
+    connection = UbusConnection()
+
     @staticmethod
-    def call_ubus(ubus_object: str, method: str, data: typing.Optional[dict] = None) -> typing.Optional[dict]:
-        """Method to call ubus executable and get data/trigger action provided by ubus objects.
+    def call_ubus(
+        ubus_object: str,
+        method: str,
+        data: typing.Optional[dict] = None,
+        timeout: typing.Optional[float] = None,
+    ) -> typing.Optional[dict]:
+        """Method to call ubus and get data/trigger action provided by ubus objects.
+
+        Persistent connection using python ubus binding is used when possible,
+        otherwise ubus executable is called.
 
         Try to return:
         * data from ubus object
         * fallback to empty dictionary in case ubus object doesn't return any
-        * None in case of runtime failure during querying the ubus
+        * None in case of runtime failure during querying the ubus (including timeout)
+
+        Calls are not limited in time unless the timeout (in seconds) is set.
 
         For example:
         `ubus call umdns reload` does not provide any output, neither it is really expected for method 'reload'.
         """
+        if UbusBackend.connection.available():
+            try:
+                return UbusBackend.connection.call(ubus_object, method, data or {}, timeout)
+            except RuntimeError as exc:
+                logger.warning("Failure during ubus call: %r", exc)
+                return None
+
+        return UbusBackend._call_ubus_cmd(ubus_object, method, data, timeout)
+
+    @staticmethod
+    def _call_ubus_cmd(
+        ubus_object: str, method: str, data: typing.Optional[dict], timeout: typing.Optional[float]
+    ) -> typing.Optional[dict]:
         cmd = [UbusBackend.UBUS_CMD, "call", ubus_object, method]
         if data:
             cmd.append(json.dumps(data))
 
-        retval, stdout, stderr = BaseCmdLine._run_command(*cmd)
+        retval, stdout, stderr = BaseCmdLine._run_command(*cmd, timeout=timeout)
         if retval != 0:
             logger.warning("Failure during ubus call: %s", stderr)
             return None
@@ -54,3 +163,31 @@ class UbusBackend(BaseCmdLine):
         except json.JSONDecodeError as exc:
             logger.warning("Failed to decode response from ubus: %r", exc)
             return None
+
+    @staticmethod
+    def call_ubus_many(
+        calls: typing.Iterable[typing.Tuple[str, str, typing.Optional[dict]]],
+        timeout: typing.Optional[float] = None,
+    ) -> typing.List[typing.Optional[dict]]:
+        """Perform several ubus calls and return their results in the same order
+
+        Calls are performed over the persistent connection one after another. When ubus
+        executable has to be used the calls are run in parallel.
+
+        :param calls: (ubus_object, method, data) tuples
+        """
+        calls = list(calls)
+        if UbusBackend.connection.available() or len(calls) < 2:
+            return [UbusBackend.call_ubus(*call, timeout=timeout) for call in calls]
+
+        results: typing.List[typing.Optional[dict]] = [None] * len(calls)
+
+        def worker(idx, call):
+            results[idx] = UbusBackend.call_ubus(*call, timeout=timeout)
+
+        threads = [threading.Thread(target=worker, args=(i, call)) for i, call in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
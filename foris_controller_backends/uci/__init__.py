@@ -22,6 +22,7 @@ import logging
 import os
 import re
 
+from foris_controller import request_context
 from foris_controller.utils import RWLock
 
 from foris_controller.app import app_info
@@ -31,6 +32,11 @@ from foris_controller_backends.cmdline import handle_command
 
 logger = logging.getLogger(__name__)
 
+_TOKEN_RE = re.compile(
+    r"""(?:[ \t\r\f\v]|\\\n)+|#[^\n]*|(\n)|((?:'[^']*'|"(?:[^"\\]|\\.)*"|\\.|[^\s'"#\\])+)""", re.S
+)
+_TOKEN_PART_RE = re.compile(r"""'([^']*)'|"((?:[^"\\]|\\.)*)"|\\(.)|([^'"\\]+)""", re.S)
+
 
 def parse_bool(value):
     if value in ("1", "on", "true", "yes", "enabled"):
@@ -47,6 +53,81 @@ def store_bool(value):
     return value
 
 
+def _quote_batch_arg(arg):
+    """ Quotes an argument so that it is passed intact through `uci batch`
+        "Tom'sNet" -> "'Tom'\\''sNet'"
+    """
+    return "'%s'" % arg.replace("'", "'\\''")
+
+
+def _unquote(token):
+    """ Converts uci token to the original value
+        "'Tom'\\''sNet'" -> "Tom'sNet"
+    """
+    result = []
+    for single, double, escaped, plain in _TOKEN_PART_RE.findall(token):
+        if double:
+            result.append(re.sub(r"\\(.)", lambda m: m.group(1).strip("\n"), double, flags=re.S))
+        else:
+            result.append(single or escaped.strip("\n") or plain)
+    return "".join(result)
+
+
+def _parse_statements(content):
+    """ Splits content of an uci file into statements (lists of unquoted tokens)
+        e.g. "option name 'Tom'\\''sNet' # comment" -> ["option", "name", "Tom'sNet"]
+    """
+    statement = []
+    pos = 0
+    while pos < len(content):
+        match = _TOKEN_RE.match(content, pos)
+        if not match:
+            raise UciException(["read"], "Parse error (unterminated quote)")
+        pos = match.end()
+        newline, token = match.groups()
+        if token:
+            statement.append(_unquote(token))
+        elif newline and statement:
+            yield statement
+            statement = []
+    if statement:
+        yield statement
+
+
+class UciConfig(list):
+    """ List of sections of an uci config which are indexed by their names and types
+    """
+
+    def __init__(self, sections=()):
+        super().__init__(sections)
+        self.sections_by_name = {}
+        self.sections_by_type = {}
+        for section in self:
+            self.sections_by_name.setdefault(section["name"], section)
+            self.sections_by_type.setdefault(section["type"], []).append(section)
+
+
+def _copy_sections(sections):
+    """ Copies parsed sections so that the cached data can't be modified
+    """
+    return UciConfig(
+        {
+            "type": section["type"],
+            "name": section["name"],
+            "data": collections.OrderedDict(
+                (k, list(v) if isinstance(v, list) else v) for k, v in section["data"].items()
+            ),
+            "anonymous": section["anonymous"],
+        }
+        for section in sections
+    )
+
+
+def _add_to_list(data, list_name, value):
+    current = data.get(list_name, [])
+    data[list_name] = (current if isinstance(current, list) else [current]) + [value]
+
+
 def get_config(data, config):
     if config not in data:
         raise UciRecordNotFound(config=config)
@@ -58,11 +139,15 @@ def get_section(data, config, section):
     named section
     """
     res = get_config(data, config)
-    res = [e for e in res if e["name"] == section]
-    if not res:
+    if isinstance(res, UciConfig):
+        res = res.sections_by_name.get(section)
+    else:
+        # only one section can be present (uci backend feature)
+        res = next((e for e in res if e["name"] == section), None)
+    if res is None:
         raise UciRecordNotFound(config, section=section)
 
-    return res[0]  # only one section can be present (uci backend feature)
+    return res
 
 
 def section_exists(data, config, section) -> bool:
@@ -91,8 +176,9 @@ def get_sections_by_type(data, config, section_type):
     get sections of specified type (anonymous as well as named)
     """
     res = get_config(data, config)
-    res = [e for e in data[config] if e["type"] == section_type]
-    return res
+    if isinstance(res, UciConfig):
+        return list(res.sections_by_type.get(section_type, []))
+    return [e for e in res if e["type"] == section_type]
 
 
 def get_section_idx(data, config, section_type, idx):
@@ -118,19 +204,246 @@ def get_option_anonymous(data, config, section_type, idx, option, default=None):
     return res
 
 
-class UciBackend(object):
-    CHANGES_DIR = "/tmp/.uci-foris-controller"
+class UciReader(object):
+    """ Read-only access to uci configs
+
+    Only the shared lock is obtained, so readers don't block each other.
+    Changes which were not commited by UciBackend are not visible.
+    """
+
     DEFAULT_CONFIG_DIR = "/etc/config/"
+    DEFAULT_SAVE_DIR = "/tmp/.uci"
     uci_lock = RWLock(app_info["lock_backend"])
+    # (config_dir, config, changes_dirs) -> (state of related files, parsed sections)
+    read_cache = {}
+    # parsed configs are memoized in the request context (see foris_controller.request_context)
+    request_memoized = True
 
     def __init__(self, config_dir=None):
+        """
+        :param config_dir: uci config directory (DEFAULT_UCI_CONFIG_DIR env or /etc/config/)
+        """
         if not config_dir:
-            config_dir = os.environ.get("DEFAULT_UCI_CONFIG_DIR", UciBackend.DEFAULT_CONFIG_DIR)
+            config_dir = os.environ.get("DEFAULT_UCI_CONFIG_DIR", UciReader.DEFAULT_CONFIG_DIR)
         logger.debug("Using uci config dir '%s'" % config_dir)
 
-        self.affected_configs = set()
         self.config_dir = config_dir
 
+    def __enter__(self):
+        UciReader.uci_lock.readlock.acquire()
+        logger.debug("UCI read lock obtained.")
+        return self
+
+    def __exit__(self, exc_type, value, traceback):
+        UciReader.uci_lock.readlock.release()
+        logger.debug("UCI read lock released.")
+
+    def _changes_dirs(self):
+        """ Dirs containing the changes which are applied on top of the config files
+        """
+        return (UciReader.DEFAULT_SAVE_DIR,)
+
+    def _drop_cached(self, config):
+        for key in [e for e in UciReader.read_cache if e[:2] == (self.config_dir, config)]:
+            UciReader.read_cache.pop(key, None)
+        request_context.invalidate("uci", self.config_dir, config)
+
+    def _section_name(self, index, section_type):
+        """ Generates a name for an anonymous section the same way as libuci does
+            (position of the section within the config and a hash of its type)
+        """
+        section_hash = 5381
+        for char in section_type.encode("utf-8"):
+            section_hash = (section_hash * 33 + char) & 0xFFFFFFFF
+        return "cfg%02x%04x" % (index, section_hash & 0xFFFF)
+
+    def _parse_config_file(self, config, content):
+        """ Parses content of the config file
+
+        :returns: sections by their names
+        :rtype: collections.OrderedDict
+        """
+        sections = collections.OrderedDict()
+        section = None
+        for statement in _parse_statements(content):
+            keyword = statement[0]
+            if keyword == "package" and len(statement) == 2:
+                continue
+            elif keyword == "config" and len(statement) in (2, 3):
+                section_type = statement[1]
+                section_name = statement[2] if len(statement) == 3 else ""
+                if section_name in sections:
+                    section = sections[section_name]
+                    continue
+                section_name = section_name or self._section_name(len(sections) + 1, section_type)
+                section = {
+                    "type": section_type,
+                    "name": section_name,
+                    "data": collections.OrderedDict(),
+                }
+                sections[section_name] = section
+            elif keyword in ("option", "list") and len(statement) == 3 and section:
+                if keyword == "option":
+                    section["data"][statement[1]] = statement[2]
+                else:
+                    _add_to_list(section["data"], statement[1], statement[2])
+            else:
+                raise UciException(["read", config], "Parse error (%s)" % " ".join(statement))
+
+        return sections
+
+    def _apply_changes(self, config, sections, content):
+        """ Applies stored uci changes (deltas) on parsed sections
+        """
+        for statement in _parse_statements(content):
+            if len(statement) != 1:
+                continue
+            change = statement[0]
+            command = change[0] if change[0] in "+-@^|~" else ""
+            path, _, value = change[len(command):].partition("=")
+            path = path.split(".")
+            if len(path) not in (2, 3) or path[0] != config:
+                continue
+            section = sections.get(path[1])
+            option = path[2] if len(path) == 3 else None
+
+            if command in ("", "+") and not option:
+                if not value:
+                    sections.pop(path[1], None)
+                elif section:
+                    section["type"] = value
+                else:
+                    sections[path[1]] = {
+                        "type": value, "name": path[1], "data": collections.OrderedDict()
+                    }
+            elif not section:
+                continue  # libuci skips changes of missing sections as well
+            elif command in ("", "+"):
+                if value:
+                    section["data"][option] = value
+                else:
+                    section["data"].pop(option, None)
+            elif command == "-":
+                if option:
+                    section["data"].pop(option, None)
+                else:
+                    del sections[path[1]]
+            elif command == "@":
+                if option:
+                    if option in section["data"]:
+                        section["data"] = collections.OrderedDict(
+                            (value if k == option else k, v) for k, v in section["data"].items()
+                        )
+                else:
+                    section["name"] = value
+                    renamed = [(value if k == path[1] else k, v) for k, v in sections.items()]
+                    sections.clear()
+                    sections.update(renamed)
+            elif command == "^" and not option and value.isdigit():
+                ordered = [e for e in sections.values() if e is not section]
+                ordered.insert(int(value), section)
+                sections.clear()
+                sections.update((e["name"], e) for e in ordered)
+            elif command == "|":
+                _add_to_list(section["data"], option, value)
+            elif command == "~":
+                if isinstance(section["data"].get(option), list):
+                    section["data"][option] = [e for e in section["data"][option] if e != value]
+                    if not section["data"][option]:
+                        del section["data"][option]
+
+    def _read_config(self, config):
+        """ Reads the config file and applies pending changes
+
+        :returns: list of sections
+        :rtype: list
+        """
+        try:
+            with open(os.path.join(self.config_dir, config), encoding="utf-8") as f:
+                sections = self._parse_config_file(config, f.read())
+        except OSError as e:
+            raise UciException(["read", config], e.strerror)
+
+        for changes_dir in self._changes_dirs():
+            try:
+                with open(os.path.join(changes_dir, config), encoding="utf-8") as f:
+                    self._apply_changes(config, sections, f.read())
+            except FileNotFoundError:
+                pass
+
+        for section in sections.values():
+            section["anonymous"] = True if re.search(r"^cfg[0-9a-f]{6}$", section["name"]) else False
+        return list(sections.values())
+
+    def _config_state(self, config):
+        """ Returns the state of files which affect the content of the config
+        """
+        res = []
+        for directory in (self.config_dir,) + self._changes_dirs():
+            try:
+                stat = os.stat(os.path.join(directory, config))
+                res.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                res.append(None)
+        return tuple(res)
+
+    def _read_config_cached(self, config):
+        """ Reads the config using cache which is invalidated when the config file
+            or pending changes are modified
+        """
+        key = (self.config_dir, config, self._changes_dirs())
+        # state is obtained before reading, so that the modified config can't be cached as current
+        state = self._config_state(config)
+        cached = UciReader.read_cache.get(key)
+        if cached and cached[0] == state:
+            logger.debug("Using cached config '%s'" % config)
+            sections = cached[1]
+        else:
+            sections = self._read_config(config)
+            UciReader.read_cache[key] = (state, sections)
+
+        return _copy_sections(sections)
+
+    def _read_config_memoized(self, config):
+        if not self.request_memoized:
+            return self._read_config_cached(config)
+
+        return request_context.memoize(
+            ("uci", self.config_dir, config, self._changes_dirs()),
+            lambda: self._read_config_cached(config),
+            _copy_sections,
+        )
+
+    def read(self, config=None):
+        if config:
+            return {config: self._read_config_memoized(config)}
+
+        return {
+            config: self._read_config_memoized(config)
+            for config in sorted(os.listdir(self.config_dir))
+            if re.match(r"^[a-zA-Z0-9_-]+$", config)
+            and os.path.isfile(os.path.join(self.config_dir, config))
+        }
+
+
+class UciBackend(UciReader):
+    CHANGES_DIR = "/tmp/.uci-foris-controller"
+    # changes made within the transaction would be hidden by the memoized data
+    request_memoized = False
+
+    def __init__(self, config_dir=None, batch=False):
+        """
+        :param config_dir: uci config directory (DEFAULT_UCI_CONFIG_DIR env or /etc/config/)
+        :param batch: queue the changes and apply them using a single `uci batch` call
+                      note that errors are raised when the queue is flushed
+                      (before reading, adding anonymous section, importing and commit)
+        """
+        super().__init__(config_dir)
+
+        self.affected_configs = set()
+        self.batch = batch
+        self._batch_queue = []
+
     def _cleanup(self):
         logger.debug("Clearing %s." % UciBackend.CHANGES_DIR)
         try:
@@ -148,20 +461,25 @@ class UciBackend(object):
         return self
 
     def __exit__(self, exc_type, value, traceback):
-        if exc_type is None:
-            if self.affected_configs:
-                self.commit()
-            logger.debug("Uci transaction ended.")
-        else:
-            logger.error("Uci transaction terminated.")
-        UciBackend.uci_lock.writelock.release()
-        logger.debug("UCI lock released.")
+        try:
+            if exc_type is None:
+                if self.affected_configs:
+                    self.commit()
+                logger.debug("Uci transaction ended.")
+            else:
+                self._batch_queue = []
+                logger.error("Uci transaction terminated.")
+        finally:
+            UciBackend.uci_lock.writelock.release()
+            logger.debug("UCI lock released.")
 
     def _run_uci_command(self, *args, **kwargs):
         """
         :return: command output
         :rtype: str
         """
+        self._flush_batch()
+
         fail_on_error = kwargs["fail_on_error"] if "fail_on_error" in kwargs else True
         changes_path_option = "-p" if args[0] == "commit" else "-P"
         export_anonymous = ["-n"] if args[0] == "export" else []
@@ -182,6 +500,120 @@ class UciBackend(object):
             raise UciException(cmdline_args, stderr)
         return stdout.decode("utf-8")
 
+    def _queue_uci_command(self, *args, fail_on_error=True):
+        """ Runs uci command or postpones it till the batch is flushed (batch mode)
+        """
+        if not self.batch or any("\n" in arg for arg in args):
+            # multiline values can't be passed via `uci batch`
+            self._run_uci_command(*args, fail_on_error=fail_on_error)
+            return
+
+        logger.debug("uci cmd '%s' queued" % str(args))
+        self._batch_queue.append((args, fail_on_error))
+
+    def _read_changes(self):
+        changes = {}
+        for file_name in os.listdir(UciBackend.CHANGES_DIR):
+            with open(os.path.join(UciBackend.CHANGES_DIR, file_name), "rb") as f:
+                changes[file_name] = f.read()
+        return changes
+
+    def _restore_changes(self, changes):
+        self._cleanup()
+        for file_name, content in changes.items():
+            with open(os.path.join(UciBackend.CHANGES_DIR, file_name), "wb") as f:
+                f.write(content)
+
+    def _target_exists(self, path):
+        """ Checks whether the section or the option (config.section[.option]) exists
+            (anonymous sections can be referenced as @type[idx])
+        """
+        path = path.split(".")
+        if len(path) not in (2, 3):
+            return True  # not sure
+        try:
+            data = self._read_config_cached(path[0])
+        except UciException:
+            return True  # not sure
+
+        match = re.match(r"^@([^\[\]]+)\[(-?[0-9]+)\]$", path[1])
+        if match:
+            sections = data.sections_by_type.get(match.group(1), [])
+            idx = int(match.group(2))
+            section = sections[idx] if -len(sections) <= idx < len(sections) else None
+        else:
+            section = data.sections_by_name.get(path[1])
+        if section is None:
+            return False
+        return len(path) == 2 or path[2] in section["data"]
+
+    def _drop_missing_deletes(self, queue):
+        """ Removes tolerant deletes of sections and options which don't exist
+
+        These commands would fail and the failure would cause that all the commands
+        of the batch are performed one by one.
+        Deletes of the targets which could be created by an earlier command within the queue
+        are kept (for anonymous sections any earlier change of the config counts).
+        """
+        res = []
+        created = set()  # config.section[.option]
+        touched = set()  # config
+        for args, fail_on_error in queue:
+            target = args[1].partition("=")[0] if len(args) > 1 else ""
+            config = target.split(".")[0]
+            if (
+                not fail_on_error
+                and args[0] == "delete"
+                and (config not in touched if "@" in target else target not in created)
+                and not self._target_exists(target)
+            ):
+                logger.debug("uci cmd '%s' dropped (nothing to delete)" % str(args))
+                continue
+            if args[0] in ("set", "add_list"):
+                created.add(target)
+            touched.add(config)
+            res.append((args, fail_on_error))
+        return res
+
+    def flush(self):
+        """ Applies the queued changes (batch mode)
+
+        :raises UciException: when some of the queued commands fails
+        """
+        self._flush_batch()
+
+    def _flush_batch(self):
+        """ Applies all queued commands using a single `uci batch` call
+
+        When some of the commands fails the changes are reverted
+        and the commands are performed one by one to preserve the error handling
+        of the particular commands.
+        """
+        if not self._batch_queue:
+            return
+
+        queue, self._batch_queue = self._batch_queue, []
+        queue = self._drop_missing_deletes(queue)
+        if not queue:
+            return
+        changes = self._read_changes()
+
+        cmdline_args = ["uci", "-c", self.config_dir, "-P", UciBackend.CHANGES_DIR, "batch"]
+        input_data = "".join(
+            "%s\n" % " ".join(_quote_batch_arg(arg) for arg in args) for args, _ in queue
+        )
+        logger.debug("uci batch (%d commands)" % len(queue))
+        retval, stdout, stderr = handle_command(*cmdline_args, input_data=input_data.encode())
+        logger.debug("retcode: %d" % retval)
+        logger.debug("stderr: %s" % stderr)
+        if not retval and not stderr.strip():
+            return
+
+        logger.debug("uci batch failed, performing commands one by one.")
+        self._restore_changes(changes)
+        for args, fail_on_error in queue:
+            self._run_uci_command(*args, fail_on_error=fail_on_error)
+
     def _run_reload_config(self):
         logger.debug("Running procd uci triggers")
 
@@ -208,25 +640,27 @@ class UciBackend(object):
             retval = self._run_uci_command("add", config, section_type, fail_on_error=False)
             retval = retval.strip()
         else:
-            self._run_uci_command("set", "%s.%s=%s" % (config, section_name, section_type))
+            self._queue_uci_command("set", "%s.%s=%s" % (config, section_name, section_type))
 
         self.affected_configs.add(config)
         return retval
         # return section name if anonymous
 
-    def del_section(self, config, section_name):
+    def del_section(self, config, section_name, fail_on_error=True):
         """
         :param section_name: anonymous or named (@anonymous[1], named)
         """
-        self._run_uci_command("delete", "%s.%s" % (config, section_name))
+        self._queue_uci_command(
+            "delete", "%s.%s" % (config, section_name), fail_on_error=fail_on_error
+        )
         self.affected_configs.add(config)
 
     def set_option(self, config, section_name, option_name, value):
-        self._run_uci_command("set", "%s.%s.%s=%s" % (config, section_name, option_name, value))
+        self._queue_uci_command("set", "%s.%s.%s=%s" % (config, section_name, option_name, value))
         self.affected_configs.add(config)
 
     def del_option(self, config, section_name, option_name, fail_on_error=True):
-        self._run_uci_command("delete", "%s.%s.%s" % (config, section_name, option_name), fail_on_error=fail_on_error)
+        self._queue_uci_command("delete", "%s.%s.%s" % (config, section_name, option_name), fail_on_error=fail_on_error)
         self.affected_configs.add(config)
 
     def add_to_list(self, config, section_name, list_name, values):
@@ -234,7 +668,7 @@ class UciBackend(object):
         merges with previous values
         """
         for value in values:
-            self._run_uci_command(
+            self._queue_uci_command(
                 "add_list", "%s.%s.%s=%s" % (config, section_name, list_name, value)
             )
 
@@ -246,21 +680,21 @@ class UciBackend(object):
         """
         if values:
             for value in values:
-                self._run_uci_command(
+                self._queue_uci_command(
                     "del_list", "%s.%s.%s=%s" % (config, section_name, list_name, value)
                 )
         else:
-            self._run_uci_command("delete", "%s.%s.%s" % (config, section_name, list_name))
+            self._queue_uci_command("delete", "%s.%s.%s" % (config, section_name, list_name))
         self.affected_configs.add(config)
 
     def replace_list(self, config, section_name, list_name, values):
         """
         replaces all list items (list may not be present)
         """
-        try:
-            self._run_uci_command("delete", "%s.%s.%s" % (config, section_name, list_name))
-        except UciException:
-            pass  # option is missing
+        # option may be missing
+        self._queue_uci_command(
+            "delete", "%s.%s.%s" % (config, section_name, list_name), fail_on_error=False
+        )
 
         self.add_to_list(config, section_name, list_name, values)
         self.affected_configs.add(config)
@@ -271,96 +705,19 @@ class UciBackend(object):
             self._run_uci_command("commit", config)
             # This revert should clean the changes directory
             self._run_uci_command("revert", config)
+            self._drop_cached(config)
 
         if self.affected_configs:
             self._run_reload_config()
 
         logger.debug("Uci configs updates were commited.")
 
-    def _convert_value(self, value):
-        """ Converts value to originall value which is was put to uci
-            "'Tom'\''sNet'" -> "Tom'sNet"
-        """
-        return "".join(
-            ["'" if e == "\\'" else e.strip("'") for e in re.split(r"('[^']*'|\\')", value) if e]
-        )
-
-    def _parse_section(self, lines):
-        result = collections.OrderedDict()
-        try:
-            while True:
-                if lines[0].startswith("package") or lines[0].startswith("config"):
-                    break
-
-                match = re.match(r"^\s*option ([^\s]+) ('.+')$", lines[0])
-                if match:
-                    result[match.group(1)] = self._convert_value(match.group(2))
-                else:
-                    match = re.match(r"^\s*list ([^\s]+) ('.+')$", lines[0])
-                    if match:
-                        list_name, value = match.group(1, 2)
-                        result[list_name] = result.get(list_name, [])
-                        result[list_name].append(self._convert_value(value))
-                lines.pop(0)
-
-        except IndexError:
-            pass
-
-        return result
-
-    def _parse_package(self, lines):
-        result = []
-        try:
-            while True:
-                if lines[0].startswith("config"):
-                    line = lines.pop(0)
-                    matched = re.match(r"^config ([^\s]+) '([^\s]+)'$", line)
-                    section_type, section_name = matched.group(1, 2)
-                    section = {
-                        "type": section_type,
-                        "name": section_name,
-                        "data": self._parse_section(lines),
-                        "anonymous": True
-                        if re.search(r"^cfg[0-9a-f]{6}$", section_name)
-                        else False,
-                    }
-                    result.append(section)
-                elif lines[0].startswith("package"):
-                    # next package
-                    break
-                else:
-                    line = lines.pop(0)
-        except IndexError:
-            pass
-
-        return result
-
-    def _parse_packages(self, lines):
-        """
-        :param lines: lines of the export output
-        :type lines: list
-        """
-        result = {}
-        if not lines:
-            return result
-        try:
-            while True:
-                package_line = lines.pop(0)
-                while not package_line.startswith("package"):
-                    package_line = lines.pop(0)
-                result[
-                    re.match(r"^package ([^\s]+)$", package_line).group(1)
-                ] = self._parse_package(lines)
-
-        except IndexError:
-            pass
-
-        return result
+    def _changes_dirs(self):
+        return (UciBackend.DEFAULT_SAVE_DIR, UciBackend.CHANGES_DIR)
 
     def read(self, config=None):
-        output = self.export_data(config)
-        lines = output.splitlines()
-        return self._parse_packages(lines)
+        self._flush_batch()
+        return super().read(config)
 
     def export_data(self, config=None):
         output = (
@@ -379,3 +736,4 @@ class UciBackend(object):
         """
         data = data if data else ""
         self._run_uci_command("import", config, input_data=data.encode())
+        self._drop_cached(config)
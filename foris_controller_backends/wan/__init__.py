@@ -31,6 +31,7 @@ from foris_controller_backends.networks import (
 )
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_named,
     parse_bool,
     section_exists,
@@ -45,7 +46,7 @@ class WanUci:
     DEFAULT_WAN_INTERFACES = ("wan", "wan6")  # wired wan
 
     def get_settings(self):
-        with UciBackend() as backend:
+        with UciReader() as backend:
             network_data = backend.read("network")
             sqm_data = backend.read("sqm")
             try:
@@ -437,7 +438,7 @@ class WanUci:
 
         :returns: True if wan configuration was changed
         """
-        with UciBackend() as backend:
+        with UciReader() as backend:
             network_data = backend.read("network")
             wan_proto = get_option_named(network_data, "network", "wan", "proto")
 
@@ -22,16 +22,16 @@ import os
 import sys
 import typing
 
-import turrishw
-
 from foris_controller import profiles
 from foris_controller.exceptions import UciException, UciRecordNotFound
 from foris_controller_backends.about import SystemInfoFiles
 from foris_controller_backends.files import BaseMatch
 from foris_controller_backends.maintain import MaintainCommands
+from foris_controller_backends.networks import get_ifaces
 from foris_controller_backends.password import ForisPasswordUci
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_named,
     parse_bool,
     store_bool,
@@ -69,7 +69,7 @@ class WebUciCommands:
 
     @staticmethod
     def _get_configurable_ifaces():
-        return [k for k, v in turrishw.get_ifaces().items() if v["type"] != "wifi"]
+        return [k for k, v in get_ifaces(cached=True).items() if v["type"] != "wifi"]
 
     @staticmethod
     def _detect_basic_workflow():
@@ -162,7 +162,7 @@ class WebUciCommands:
         return True
 
     def get_data(self):
-        with UciBackend() as backend:
+        with UciReader() as backend:
             data = backend.read("foris")
 
         return {
@@ -188,7 +188,7 @@ class WebUciCommands:
                 backend.set_option("foris", "wizard", "finished", store_bool(True))
 
     def get_guide(self):
-        with UciBackend() as backend:
+        with UciReader() as backend:
             data = backend.read("foris")
         current_workflow = get_option_named(
             data, "foris", "wizard", "workflow", WebUciCommands._detect_basic_workflow()
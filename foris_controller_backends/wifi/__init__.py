@@ -26,13 +26,14 @@ from foris_controller.exceptions import (
     UciException,
     UciRecordNotFound,
 )
-from foris_controller.utils import sort_by_natural_order
+from foris_controller.utils import TTLCache, sort_by_natural_order
 from foris_controller_backends.cmdline import BaseCmdLine, AsyncCommand, AsyncMultipleCommands
 from foris_controller_backends.guest import GuestUci
 from foris_controller_backends.maintain import MaintainCommands
 from foris_controller_backends.ubus import UbusBackend
 from foris_controller_backends.uci import (
     UciBackend,
+    UciReader,
     get_option_anonymous,
     get_sections_by_type,
     parse_bool,
@@ -51,6 +52,8 @@ class WifiUci:
     # reverse lookup of json schema values and uci config values
     WIFI_ENC_UCI_TO_MODES = {v: k for k, v in WIFI_ENC_MODES_TO_UCI.items()}
     WIFI_UCI_DEFAULT_ENC_MODE = "sae-mixed"
+    # device name -> bands supported by the device
+    bands_cache = TTLCache()
 
     @staticmethod
     def get_wifi_devices(backend):
@@ -82,6 +85,12 @@ class WifiUci:
 
     @staticmethod
     def _get_device_bands(device_name: str) -> list:
+        """Get bands supported by the device (cached, see `TTLCache`)"""
+        bands = WifiUci.bands_cache.get(device_name, lambda: WifiUci._read_device_bands(device_name))
+        return bands or []
+
+    @staticmethod
+    def _read_device_bands(device_name: str) -> typing.Optional[list]:
         DEFAULT_HTMODE = "NOHT"
 
         # map bands to compatible hwmodes values for reforis
@@ -95,13 +104,11 @@ class WifiUci:
         }
 
         request_msg = {"device": device_name}
-        ht_data = UbusBackend.call_ubus("iwinfo", "info", request_msg)
-        if not ht_data:
-            return []
-
-        freq_data = UbusBackend.call_ubus("iwinfo", "freqlist", request_msg)
-        if not freq_data:
-            return []
+        ht_data, freq_data = UbusBackend.call_ubus_many(
+            [("iwinfo", "info", request_msg), ("iwinfo", "freqlist", request_msg)]
+        )
+        if not ht_data or not freq_data:
+            return None
 
         channels = WifiUci._get_frequencies(freq_data, device_name)
         htmodes = WifiUci._get_htmodes(ht_data["htmodes"])
@@ -314,7 +321,7 @@ class WifiUci:
         """
         devices = []
         try:
-            with UciBackend() as backend:
+            with UciReader() as backend:
                 data = backend.read("wireless")
             device_sections = self._get_device_sections(data)
             for device_section in device_sections:
@@ -460,7 +467,7 @@ class WifiUci:
         "rtype: bool
         """
         try:
-            with UciBackend() as backend:
+            with UciBackend(batch=True) as backend:
                 data = backend.read("wireless")  # data were read to find corresponding sections
                 device_sections = self._get_device_sections(data)
 
@@ -33,7 +33,14 @@ class IntrospectModule(BaseModule):
         """
         return {"modules": self.handler.list_modules()}
 
+    def action_get_output_validation(self, data):
+        """
+        :returns: validation policy of the replies and counts of the replies which failed
+        :rtype: dict
+        """
+        return self.handler.get_output_validation()
+
 
-@wrap_required_functions(["list_modules"])
+@wrap_required_functions(["list_modules", "get_output_validation"])
 class Handler:
     pass
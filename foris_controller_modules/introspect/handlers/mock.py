@@ -20,6 +20,7 @@
 import logging
 
 from foris_controller.handler_base import BaseMockHandler
+from foris_controller.message_router import output_validation
 from foris_controller.utils import logger_wrapper
 
 from .. import Handler
@@ -52,3 +53,8 @@ class MockIntrospectHandler(Handler, BaseMockHandler):
     @logger_wrapper(logger)
     def list_modules():
         return FORIS_CONTROLLER_MODULES
+
+    @staticmethod
+    @logger_wrapper(logger)
+    def get_output_validation():
+        return output_validation.stats()
@@ -21,6 +21,7 @@ import logging
 
 from foris_controller.app import app_info
 from foris_controller.handler_base import BaseOpenwrtHandler
+from foris_controller.message_router import output_validation
 from foris_controller.utils import get_modules, logger_wrapper
 
 from .. import Handler
@@ -35,3 +36,8 @@ class OpenwrtIntrospectHandler(Handler, BaseOpenwrtHandler):
         modules = get_modules(app_info["filter_modules"], app_info["extra_module_paths"])
 
         return [mod[0] for mod in modules]
+
+    @staticmethod
+    @logger_wrapper(logger)
+    def get_output_validation():
+        return output_validation.stats()
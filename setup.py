@@ -133,6 +133,7 @@ setup(
         "mqtt": ["paho-mqtt"],
         "zeroconf": ["zeroconf", "ifaddr", "paho-mqtt"],
         "client-socket": ["foris-client"],
+        "fast-validation": ["fastjsonschema"],
         "tests": [
             "pytest",
             "foris-controller-testtools",
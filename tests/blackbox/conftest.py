@@ -31,6 +31,9 @@ DEFAULT_UCI_CONFIG_DIR = os.path.join(
 
 SCRIPT_ROOT_DIR = str(pathlib.Path(__file__).parent / "test_root")
 
+# mocked hardware is changed between the tests, so the controller shouldn't cache it
+os.environ["FC_CAPABILITY_CACHE_TTL"] = "0"
+
 
 @pytest.fixture(scope="function")
 def lan_dnsmasq_files():
@@ -121,6 +124,7 @@ def netboot_configured():
 def env_overrides():
     return {
         "FC_DISABLE_ADV_CACHE": "1",
+        "FC_MQTT_ANNOUNCER_HEARTBEAT": "0.5",
     }
 
 
@@ -30,3 +30,13 @@ def test_list_modules(infrastructure):
     assert "error" not in res
     assert "data" in res
     assert isinstance(res["data"]["modules"], list)
+
+
+def test_get_output_validation(infrastructure):
+    res = infrastructure.process_message(
+        {"module": "introspect", "action": "get_output_validation", "kind": "request"}
+    )
+
+    assert "error" not in res
+    assert res["data"]["policy"] == "always"
+    assert isinstance(res["data"]["failures"], list)
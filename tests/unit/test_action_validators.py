@@ -0,0 +1,95 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright 2023, CZ.NIC z.s.p.o. (https://www.nic.cz/)
+
+import pytest
+
+from jsonschema import ValidationError
+
+from foris_controller import action_validators
+from foris_controller.app import app_info
+from foris_controller.utils import get_validator_dirs
+
+MESSAGES = [
+    {"module": "lan", "kind": "request", "action": "get_settings"},
+    {"module": "lan", "kind": "request", "action": "get_settings", "data": {}},
+    {"module": "web", "kind": "request", "action": "set_language", "data": {"language": "cs"}},
+    {"module": "web", "kind": "request", "action": "set_language", "data": {"language": "czech"}},
+    {"module": "web", "kind": "reply", "action": "set_language", "data": {"result": True}},
+    {"module": "web", "kind": "reply", "action": "set_language", "data": {"result": "yes"}},
+    {"module": "web", "kind": "request", "action": "unknown_action"},
+    {
+        "module": "lan",
+        "kind": "request",
+        "action": "set_dhcp_client",
+        "data": {"ip": "192.168.1.5", "mac": "11:22:33:44:55:66", "hostname": "a"},
+    },
+    {
+        "module": "lan",
+        "kind": "request",
+        "action": "set_dhcp_client",
+        "data": {"ip": "192.168.1.5", "mac": "11:22:33:44:55", "hostname": "a"},
+    },
+    {
+        "module": "lan",
+        "kind": "request",
+        "action": "set_dhcp_client",
+        "data": {"ip": "192.168.1.300", "mac": "11:22:33:44:55:66", "hostname": "a"},
+    },
+]
+
+
+@pytest.fixture
+def validator(monkeypatch):
+    foris_schema = pytest.importorskip("foris_schema")
+    validator = foris_schema.ForisValidator(*get_validator_dirs(None))
+    monkeypatch.setitem(app_info, "validator", validator)
+    yield validator
+
+
+def _is_valid(validate, message):
+    try:
+        validate(message)
+        return True
+    except ValidationError:
+        return False
+
+
+@pytest.mark.parametrize("fast", [True, False], ids=["fastjsonschema", "jsonschema"])
+def test_same_results(validator, monkeypatch, fast):
+    if fast:
+        pytest.importorskip("fastjsonschema")
+    else:
+        monkeypatch.setattr(action_validators, "fastjsonschema", None)
+
+    cache = action_validators.ActionValidators()
+    monkeypatch.setattr(action_validators, "action_validators", cache)
+
+    for message in MESSAGES:
+        assert _is_valid(cache.validate, message) == _is_valid(validator.validate, message)
+
+    assert cache.get("lan", "set_dhcp_client", "request") is cache.get(
+        "lan", "set_dhcp_client", "request"
+    )
+
+
+def test_validator_replaced(validator, monkeypatch):
+    cache = action_validators.ActionValidators()
+    first = cache.get("lan", "get_settings", "request")
+    assert first is not None
+    assert cache.get("lan", "get_settings", "request") is first
+
+    monkeypatch.setitem(app_info, "validator", type(validator)(*get_validator_dirs(None)))
+    assert cache.get("lan", "get_settings", "request") is not first
+
+
+def test_used_definitions():
+    definitions = {
+        "a": {"$ref": "#/definitions/b"},
+        "b": {"type": "string"},
+        "c": {"$ref": "#/definitions/missing"},
+    }
+    schema = {"properties": {"x": {"$ref": "#/definitions/a"}}}
+    assert action_validators._used_definitions(schema, definitions) == {
+        "a": definitions["a"],
+        "b": definitions["b"],
+    }
@@ -0,0 +1,55 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright 2023, CZ.NIC z.s.p.o. (https://www.nic.cz/)
+
+import json
+
+from foris_controller import compression
+
+
+def test_requested():
+    envelope = {"reply_msg_id": "1", "compression": "zlib"}
+    assert compression.requested(envelope) == "zlib"
+    assert envelope == {"reply_msg_id": "1"}
+
+    envelope = {"reply_msg_id": "1", "compression": "unknown"}
+    assert compression.requested(envelope) is None
+    assert envelope == {"reply_msg_id": "1"}
+
+    assert compression.requested({"reply_msg_id": "1"}) is None
+    assert compression.requested([]) is None
+
+
+def test_encode():
+    large = json.dumps({"data": [{"mac": "11:22:33:44:55:66"}] * 1000}).encode("utf8")
+    small = json.dumps({"data": {"result": True}}).encode("utf8")
+
+    encoded = compression.encode(large, "zlib")
+    assert len(encoded) < len(large)
+    assert json.loads(encoded)["compression"] == "zlib"
+    assert compression.decode(encoded) == json.loads(large)
+
+    assert compression.encode(large, None) == large
+    assert compression.encode(small, "zlib") == small
+    assert compression.decode(small) == json.loads(small)
+
+
+def test_encode_not_smaller(monkeypatch):
+    monkeypatch.setattr(compression, "THRESHOLD", 0)
+    # the envelope of short data is larger than the data
+    data = json.dumps({"data": {"result": True}}).encode("utf8")
+    assert compression.encode(data, "zlib") == data
+
+
+def test_encode_iter():
+    large = {"data": [{"mac": "11:22:33:44:55:66", "index": i} for i in range(1000)]}
+    pieces = json.JSONEncoder().iterencode(large)
+    encoded = "".join(compression.encode_iter(pieces, "zlib")).encode("utf8")
+    assert json.loads(encoded)["compression"] == "zlib"
+    assert compression.decode(encoded) == large
+
+    pieces = json.JSONEncoder().iterencode(large)
+    assert "".join(compression.encode_iter(pieces, None)) == json.dumps(large)
+
+    small = {"data": {"result": True}}
+    pieces = json.JSONEncoder().iterencode(small)
+    assert "".join(compression.encode_iter(pieces, "zlib")) == json.dumps(small)
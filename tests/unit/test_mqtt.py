@@ -0,0 +1,476 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright 2023, CZ.NIC z.s.p.o. (https://www.nic.cz/)
+
+import hashlib
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("paho.mqtt")
+
+from jsonschema import ValidationError  # noqa: E402
+from paho.mqtt import client as mqtt  # noqa: E402
+from paho.mqtt.packettypes import PacketTypes  # noqa: E402
+from paho.mqtt.properties import Properties  # noqa: E402
+
+from foris_controller.app import app_info  # noqa: E402
+from foris_controller.buses.mqtt import (  # noqa: E402
+    PUBLISH_TIMEOUT,
+    Advertizer,
+    AnnouncerScheduler,
+    EntryPointAnnouncer,
+    IntrospectionResponses,
+    MqttListener,
+    Scheduler,
+    TopicRouter,
+)
+
+
+class FakeInfo:
+    """ Mocked paho MQTTMessageInfo """
+
+    def __init__(self, rc=mqtt.MQTT_ERR_SUCCESS, published=True):
+        self.rc = rc
+        self.mid = 1
+        self.published = published
+        self.waits = []
+
+    def wait_for_publish(self, timeout=None):
+        self.waits.append(timeout)
+
+    def is_published(self):
+        return self.published
+
+
+class FakeClient:
+    """ Mocked paho client which records the published messages """
+
+    rc = mqtt.MQTT_ERR_SUCCESS
+    published = True
+
+    def __init__(self, client_id=None, clean_session=None, protocol=None):
+        self.client_id = client_id
+        self.messages = []
+        self.infos = []
+        self.subscribed = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.messages.append(
+            {
+                "topic": topic,
+                "payload": payload,
+                "qos": qos,
+                "retain": retain,
+                "properties": properties,
+            }
+        )
+        info = FakeInfo(self.rc, self.published)
+        self.infos.append(info)
+        return info
+
+    def subscribe(self, topic, qos=0):
+        self.subscribed.append(topic)
+        return mqtt.MQTT_ERR_SUCCESS, len(self.subscribed)
+
+    def connect(self, *args, **kwargs):
+        pass
+
+    def connect_async(self, *args, **kwargs):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def reconnect_delay_set(self, *args, **kwargs):
+        pass
+
+    def username_pw_set(self, *args, **kwargs):
+        pass
+
+
+class FakeRouter:
+    """ Router which replies once the release event is set """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.processed = []
+
+    def process_message(self, message):
+        self.release.wait(5)
+        self.processed.append(message)
+        return {"module": message["module"], "kind": "reply", "action": message["action"]}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def listener(monkeypatch):
+    monkeypatch.setattr(mqtt, "Client", FakeClient)
+    for key, value in {
+        "controller_id": "0000000A00000214",
+        "mqtt_credentials": None,
+        "mqtt_workers": 1,
+        "mqtt_queue_size": 1,
+        "mqtt_v5": False,
+    }.items():
+        monkeypatch.setitem(app_info, key, value)
+    router = FakeRouter()
+    monkeypatch.setattr(MqttListener, "router", router)
+
+    listener = MqttListener("localhost", 11883)
+    yield listener
+    router.release.set()
+    listener.executor.shutdown(wait=True)
+
+
+def request(listener, reply_id, action="get_settings", properties=None):
+    listener.start_message_worker(
+        f"foris-controller/0000000A00000214/reply/{reply_id}",
+        reply_id,
+        {"module": "wifi", "kind": "request", "action": action},
+        properties,
+    )
+
+
+def test_busy_reply(listener):
+    # one request is processed and one is waiting in the queue
+    request(listener, "first")
+    request(listener, "second")
+    assert listener.pending == 2
+
+    request(listener, "third")
+    assert listener.pending == 2
+    busy = listener.reply_client.messages[-1]
+    assert busy["topic"] == "foris-controller/0000000A00000214/reply/third"
+    assert busy["retain"]
+    assert '"errors"' in busy["payload"] and "busy" in busy["payload"]
+    assert "third" not in listener.list_working_replies()
+    assert listener.scheduler.backlog == 1  # the busy reply is cleared later
+
+    MqttListener.router.release.set()
+    wait_for(lambda: listener.pending == 0)
+    assert [e["action"] for e in MqttListener.router.processed] == ["get_settings"] * 2
+
+    # the queue is free again
+    request(listener, "fourth")
+    wait_for(lambda: listener.pending == 0)
+    assert len(MqttListener.router.processed) == 3
+
+
+def test_publish_reply(listener):
+    MqttListener.router.release.set()
+    request(listener, "first")
+    # the retained reply is cleared later
+    wait_for(lambda: listener.scheduler.backlog == 1)
+
+    reply = listener.reply_client.messages[0]
+    assert reply["topic"] == "foris-controller/0000000A00000214/reply/first"
+    assert reply["qos"] == 1
+    assert reply["retain"]
+    assert json.loads(reply["payload"]) == {
+        "module": "wifi", "kind": "reply", "action": "get_settings"
+    }
+    # broker confirmation was awaited
+    assert listener.reply_client.infos[0].waits == [PUBLISH_TIMEOUT]
+    # the reply is working till the retained message is cleared
+    assert "first" in listener.list_working_replies()
+
+
+def test_publish_reply_not_confirmed(listener):
+    listener.reply_client.published = False
+    info = listener._publish_retained("topic", "payload")
+    assert not listener._wait_published("topic", info, 0.1)
+    assert info.waits == [0.1]
+
+    # not connected => message is queued by paho and there is nothing to wait for
+    listener.reply_client.rc = mqtt.MQTT_ERR_NO_CONN
+    assert listener._publish_retained("topic", "payload") is None
+    listener._publish_reply("topic", {"kind": "reply"})
+    assert listener.reply_client.infos[-1].waits == []
+
+
+def test_scheduler_batches():
+    calls = []
+    done = threading.Event()
+
+    def first(items):
+        calls.append(("first", items))
+
+    def second(items):
+        calls.append(("second", items))
+        done.set()
+
+    scheduler = Scheduler("test_scheduler", batch_window=0.5)
+    scheduler.schedule(0.3, first, 3)
+    scheduler.schedule(0.2, first, 2)
+    scheduler.schedule(0.1, first, 1)
+    scheduler.schedule(0.2, second, "a")
+    scheduler.schedule(5.0, first, "later")
+    assert scheduler.backlog == 5
+
+    assert done.wait(5)
+    # entries due within the batch window are passed to a single call in the order of due time
+    assert calls == [("first", [1, 2, 3]), ("second", ["a"])]
+    assert scheduler.backlog == 1
+
+
+def test_scheduler_backlog():
+    calls = []
+    scheduler = Scheduler("test_scheduler")
+    for i in range(100):
+        scheduler.schedule(0.05, calls.extend, i)
+    scheduler.schedule(0.0, lambda items: 1 / 0, "failing")  # failure doesn't stop the scheduler
+    assert scheduler.backlog == 101
+
+    wait_for(lambda: scheduler.backlog == 0 and len(calls) == 100)
+    assert calls == list(range(100))
+
+
+def v5_message(topic, payload, response_topic="client/replies", correlation_data=b"\x01\x02"):
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.ResponseTopic = response_topic
+    properties.CorrelationData = correlation_data
+    return SimpleNamespace(topic=topic, payload=json.dumps(payload), properties=properties)
+
+
+def test_v5_response_topic(listener):
+    MqttListener.router.release.set()
+    prefix = "foris-controller/0000000A00000214"
+
+    # reply to the request is sent by a worker using the reply client
+    listener.client.on_message(
+        listener.client, None, v5_message(f"{prefix}/request/wifi/action/get_settings", {})
+    )
+    wait_for(lambda: listener.reply_client.messages and not listener.list_working_replies())
+    reply = listener.reply_client.messages[0]
+    assert reply["topic"] == "client/replies"
+    assert not reply["retain"]
+    assert reply["properties"].CorrelationData == b"\x01\x02"
+    # nothing to clear
+    assert listener.scheduler.backlog == 0
+
+    # introspection replies are sent right away
+    listener.client.on_message(
+        listener.client,
+        None,
+        v5_message(f"{prefix}/working_replies", {}, "client/other", b"\x03"),
+    )
+    reply = listener.client.messages[0]
+    assert reply["topic"] == "client/other"
+    assert not reply["retain"]
+    assert reply["properties"].CorrelationData == b"\x03"
+    assert json.loads(reply["payload"]) == []
+
+
+def test_v5_non_object_payload(listener):
+    prefix = "foris-controller/0000000A00000214"
+    for payload in ([], "string", 1, None):
+        listener.client.on_message(
+            listener.client, None, v5_message(f"{prefix}/working_replies", payload)
+        )
+    assert listener.client.messages == []
+    assert listener.reply_client.messages == []
+
+
+def test_v3_reply_topic(listener):
+    prefix = "foris-controller/0000000A00000214"
+    msg = SimpleNamespace(
+        topic=f"{prefix}/working_replies", payload=json.dumps({"reply_msg_id": "abc"})
+    )
+    listener.client.on_message(listener.client, None, msg)
+    reply = listener.client.messages[0]
+    assert reply["topic"] == f"{prefix}/reply/abc"
+    assert reply["retain"]
+    assert reply["properties"] is None
+
+
+def test_topic_router():
+    def handler(name):
+        return lambda *args: name
+
+    router = TopicRouter()
+    router.add("fc/id/list", handler("list"))
+    router.add("fc/id/request/+/list", handler("actions"))
+    router.add("fc/id/request/+/action/+", handler("action"))
+    router.add("fc/id/request/wifi/action/reset", handler("reset"))
+    assert router.filters == [
+        "fc/id/list",
+        "fc/id/request/+/list",
+        "fc/id/request/+/action/+",
+        "fc/id/request/wifi/action/reset",
+    ]
+
+    def match(topic):
+        found, levels = router.match(topic)
+        return (found() if found else None), levels
+
+    assert match("fc/id/list") == ("list", [])
+    assert match("fc/id/request/wifi/list") == ("actions", ["wifi"])
+    assert match("fc/id/request/wifi/action/get_settings") == ("action", ["wifi", "get_settings"])
+    # exact level is preferred
+    assert match("fc/id/request/wifi/action/reset") == ("reset", [])
+    assert match("fc/id/request/lan/action/reset") == ("action", ["lan", "reset"])
+    # + matches a single level only
+    assert match("fc/id/request/wifi/action") == (None, [])
+    assert match("fc/id/request/wifi/action/reset/more") == (None, [])
+    assert match("fc/other/list") == (None, [])
+
+
+@pytest.fixture
+def introspection(monkeypatch):
+    schemas = {
+        "base": {"type": "object"},
+        "error": {"type": "object", "required": ["errors"]},
+        "wifi": {"oneOf": [{"description": "wifi"}]},
+    }
+    prepared = []
+
+    def list_modules():
+        prepared.append("list")
+        return [{"name": "wifi", "actions": ["get_settings", "update_settings"]}]
+
+    monkeypatch.setattr(MqttListener, "list_modules", staticmethod(list_modules))
+    monkeypatch.setattr(MqttListener, "get_named_schemas", staticmethod(lambda: dict(schemas)))
+    monkeypatch.setitem(app_info, "modules", {"wifi": SimpleNamespace(version="1.0")})
+    monkeypatch.setitem(app_info, "filter_modules", [])
+    monkeypatch.setitem(app_info, "extra_module_paths", [])
+    yield IntrospectionResponses(), schemas, prepared
+
+
+def test_introspection_responses(introspection):
+    responses, _, prepared = introspection
+
+    assert json.loads(responses.get("list").payload) == [
+        {"name": "wifi", "actions": ["get_settings", "update_settings"]}
+    ]
+    assert json.loads(responses.list_actions("wifi")) == ["get_settings", "update_settings"]
+    assert responses.list_actions("unknown") == b"[]"
+    assert responses.get("unknown") is None
+    assert len(prepared) == 1
+
+    # loaded modules changed
+    app_info["modules"]["wifi"] = SimpleNamespace(version="1.1")
+    responses.get("list")
+    assert len(prepared) == 2
+
+
+def test_get_schemas_hashes(introspection):
+    responses, schemas, _ = introspection
+
+    # no hashes => all schemas (same as before)
+    full = responses.get_schemas({})
+    assert json.loads(full) == list(schemas.values())
+    full_hash = hashlib.sha256(full).hexdigest()
+
+    assert responses.get_schemas({"hash": full_hash}) == {"hash": full_hash, "not_modified": True}
+
+    res = responses.get_schemas({"hash": "outdated"})
+    assert res["hash"] == full_hash
+    assert res["hashes"].keys() == schemas.keys()
+    assert res["schemas"] == schemas
+
+    # only the schemas which differ are sent
+    hashes = dict(res["hashes"])
+    hashes["wifi"] = "outdated"
+    res = responses.get_schemas({"hash": "outdated", "hashes": hashes})
+    assert res["schemas"] == {"wifi": schemas["wifi"]}
+
+    # hashes are stable
+    assert IntrospectionResponses().get_schemas({"hashes": {}})["hashes"] == res["hashes"]
+
+
+class FakeValidator:
+    def __init__(self):
+        self.validated = []
+        self.fail = False
+
+    def validate(self, msg):
+        self.validated.append(msg)
+        if self.fail:
+            raise ValidationError("invalid")
+
+
+def test_advertizer(monkeypatch):
+    validator = FakeValidator()
+    monkeypatch.setitem(app_info, "validator", validator)
+    monkeypatch.setitem(app_info, "controller_id", "0000000A00000214")
+    adv_base = SimpleNamespace(data={"state": "running", "id": "0000000A00000214"})
+    adv_base.build = lambda: dict(adv_base.data)
+    client = FakeClient()
+    working_replies = {}
+    advertizer = Advertizer(client, working_replies, threading.Lock(), heartbeat=0.2)
+
+    advertizer.publish(adv_base)
+    advertizer.publish(adv_base)
+    assert len(client.messages) == 1
+    assert client.messages[0]["topic"] == (
+        "foris-controller/0000000A00000214/notification/remote/action/advertize"
+    )
+    assert json.loads(client.messages[0]["payload"])["data"] == {
+        "state": "running", "id": "0000000A00000214", "working_replies": []
+    }
+    assert len(validator.validated) == 1
+
+    # forced
+    advertizer.publish(adv_base, force=True)
+    assert len(client.messages) == 2
+
+    # heartbeat
+    time.sleep(0.25)
+    advertizer.publish(adv_base)
+    assert len(client.messages) == 3
+    assert client.messages[2]["payload"] == client.messages[0]["payload"]
+    assert len(validator.validated) == 1
+
+    # change is published right away
+    working_replies["abc"] = time.monotonic()
+    advertizer.publish(adv_base)
+    assert len(client.messages) == 4
+    assert json.loads(client.messages[3]["payload"])["data"]["working_replies"] == ["abc"]
+    assert len(validator.validated) == 2
+
+    # invalid advertizement is not published
+    validator.fail = True
+    adv_base.data["state"] = "exited"
+    advertizer.publish(adv_base)
+    assert len(client.messages) == 4
+
+
+def test_announcer_scheduler_timeouts(caplog):
+    published = []
+    scheduler = AnnouncerScheduler(published.append)
+
+    def slow():
+        time.sleep(0.3)
+        return {"module": "slow"}
+
+    scheduler.add(EntryPointAnnouncer("slow", 0.05, slow, timeout=0.1))
+    scheduler.add(EntryPointAnnouncer("fast", 0.05, lambda: {"module": "fast"}, timeout=0.1))
+    try:
+        wait_for(lambda: scheduler.stats()["slow"]["runs"] >= 2)
+    finally:
+        scheduler.stop()
+        scheduler.executor.shutdown(wait=True)
+
+    stats = scheduler.stats()
+    assert stats["slow"]["timeouts"] == stats["slow"]["runs"]
+    assert stats["slow"]["max_duration"] >= 0.3
+    assert stats["fast"]["timeouts"] == 0
+    # slow announcer doesn't block the fast one
+    assert stats["fast"]["runs"] > stats["slow"]["runs"]
+
+    # data of the slow announcer are dropped
+    assert {"module": "slow"} not in published
+    assert {"module": "fast"} in published
+    assert "Announcer 'slow' is still running" in caplog.text
@@ -0,0 +1,47 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright 2023, CZ.NIC z.s.p.o. (https://www.nic.cz/)
+
+import pytest
+
+from foris_controller.app import app_info
+from foris_controller.message_router import OutputValidation
+
+
+@pytest.fixture
+def output_validation():
+    orig = {k: app_info.get(k) for k in ("validate_output", "validate_output_rate")}
+    yield OutputValidation()
+    app_info.update(orig)
+
+
+def test_policies(output_validation):
+    app_info["validate_output"] = None
+    assert output_validation.policy == "always"
+    assert output_validation.should_validate()
+
+    app_info["validate_output"] = "off"
+    assert not any(output_validation.should_validate() for _ in range(100))
+
+    app_info["validate_output"] = "sampled"
+    app_info["validate_output_rate"] = 0.0
+    assert not any(output_validation.should_validate() for _ in range(100))
+    app_info["validate_output_rate"] = 1.0
+    assert all(output_validation.should_validate() for _ in range(100))
+
+
+def test_failures(output_validation):
+    app_info["validate_output"] = "sampled"
+    app_info["validate_output_rate"] = None
+    assert output_validation.stats() == {
+        "policy": "sampled",
+        "rate": OutputValidation.RATE_DEFAULT,
+        "failures": [],
+    }
+
+    output_validation.record_failure("wifi", "get_settings")
+    output_validation.record_failure("lan", "get_settings")
+    output_validation.record_failure("wifi", "get_settings")
+    assert output_validation.stats()["failures"] == [
+        {"module": "lan", "action": "get_settings", "count": 1},
+        {"module": "wifi", "action": "get_settings", "count": 2},
+    ]
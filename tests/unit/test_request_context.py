@@ -0,0 +1,51 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright 2023, CZ.NIC z.s.p.o. (https://www.nic.cz/)
+
+import pytest
+
+from foris_controller import request_context
+
+
+def test_memoize_outside_context():
+    calls = []
+    assert request_context.memoize(("key",), lambda: calls.append(1) or len(calls)) == 1
+    assert request_context.memoize(("key",), lambda: calls.append(1) or len(calls)) == 2
+
+
+def test_memoize_inside_context():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return {"calls": len(calls)}
+
+    with request_context.request_context():
+        assert request_context.memoize(("key",), factory) == {"calls": 1}
+        # returned value is a copy
+        request_context.memoize(("key",), factory)["calls"] = 100
+        assert request_context.memoize(("key",), factory) == {"calls": 1}
+
+    with request_context.request_context():
+        assert request_context.memoize(("key",), factory) == {"calls": 2}
+
+
+def test_memoize_exception():
+    def factory():
+        raise ValueError()
+
+    with request_context.request_context():
+        with pytest.raises(ValueError):
+            request_context.memoize(("key",), factory)
+        assert request_context.memoize(("key",), lambda: 1) == 1
+
+
+def test_invalidate():
+    with request_context.request_context():
+        request_context.memoize(("uci", "/etc/config", "network"), lambda: 1)
+        request_context.memoize(("uci", "/etc/config", "wireless"), lambda: 1)
+        request_context.invalidate("uci", "/etc/config", "network")
+        assert request_context.memoize(("uci", "/etc/config", "network"), lambda: 2) == 2
+        assert request_context.memoize(("uci", "/etc/config", "wireless"), lambda: 2) == 1
+
+        request_context.invalidate()
+        assert request_context.memoize(("uci", "/etc/config", "wireless"), lambda: 3) == 3
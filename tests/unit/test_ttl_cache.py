@@ -0,0 +1,74 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright 2023, CZ.NIC z.s.p.o. (https://www.nic.cz/)
+
+import time
+
+from foris_controller.utils import TTLCache
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {"calls": self.calls}
+
+
+def test_ttl_cache_hit():
+    cache = TTLCache(ttl=60)
+    counter = Counter()
+
+    assert cache.get("key", counter) == {"calls": 1}
+    assert cache.get("key", counter) == {"calls": 1}
+    assert counter.calls == 1
+
+    # returned value is a copy
+    cache.get("key", counter)["calls"] = 100
+    assert cache.get("key", counter) == {"calls": 1}
+
+
+def test_ttl_cache_expire():
+    cache = TTLCache(ttl=0.1)
+    counter = Counter()
+
+    assert cache.get("key", counter) == {"calls": 1}
+    time.sleep(0.2)
+    assert cache.get("key", counter) == {"calls": 2}
+
+
+def test_ttl_cache_disabled():
+    cache = TTLCache(ttl=0)
+    counter = Counter()
+
+    cache.get("key", counter)
+    cache.get("key", counter)
+    assert counter.calls == 2
+
+
+def test_ttl_cache_none_not_cached():
+    cache = TTLCache(ttl=60)
+    calls = []
+
+    def factory():
+        calls.append(None)
+        return None
+
+    assert cache.get("key", factory) is None
+    assert cache.get("key", factory) is None
+    assert len(calls) == 2
+
+
+def test_ttl_cache_invalidate():
+    cache = TTLCache(ttl=60)
+    other = TTLCache(ttl=60)
+    counter = Counter()
+
+    cache.get("key", counter)
+    cache.invalidate("key")
+    assert cache.get("key", counter) == {"calls": 2}
+
+    other.get("key", counter)
+    TTLCache.invalidate_all()
+    assert cache.get("key", counter) == {"calls": 4}
+    assert other.get("key", counter) == {"calls": 5}
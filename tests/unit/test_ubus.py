@@ -2,6 +2,9 @@
 # Copyright 2022, CZ.NIC z.s.p.o. (https://www.nic.cz/)
 
 import os
+import sys
+import threading
+import time
 from pathlib import Path
 
 import pytest
@@ -53,3 +56,125 @@ def test_ubus_call_nonexisting_object(custom_cmdline_root, ubus_backend):
     data = ubus_backend.call_ubus(ubus_object="nonsense", method="foomethod")
 
     assert data is None
+
+
+def test_ubus_call_with_timeout(custom_cmdline_root, ubus_backend):
+    """Check that explicit timeout is accepted and the call still returns data."""
+    data = ubus_backend.call_ubus(ubus_object="iwinfo", method="info", data={"device": "radio0"}, timeout=5)
+
+    assert isinstance(data, dict)
+    assert bool(data)
+
+
+def test_ubus_call_many(custom_cmdline_root, ubus_backend):
+    """Check that results of multiple calls are returned in the order of the calls."""
+    calls = [
+        ("iwinfo", "info", {"device": "radio0"}),
+        ("nonsense", "foomethod", None),
+        ("dummy_noreturn", "reload", None),
+    ]
+    data = ubus_backend.call_ubus_many(calls)
+
+    assert data == [ubus_backend.call_ubus(*call) for call in calls]
+    assert bool(data[0])
+    assert data[1] is None
+    assert data[2] == {}
+
+
+class FakeUbus:
+    """Mocked python ubus binding (single connection per process)"""
+
+    def __init__(self):
+        self.connected = False
+        self.connects = 0
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.timeouts = []
+        self.fail = False
+        self._lock = threading.Lock()
+
+    def get_connected(self):
+        return self.connected
+
+    def connect(self, *args):
+        self.connected = True
+        self.connects += 1
+
+    def disconnect(self):
+        self.connected = False
+
+    def call(self, ubus_object, method, data, timeout=None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.active, self.max_active)
+        time.sleep(0.01)
+        with self._lock:
+            self.active -= 1
+            self.calls.append((ubus_object, method))
+            self.timeouts.append(timeout)
+        if self.fail:
+            raise RuntimeError("Failed")
+        return [{"object": ubus_object, "method": method}]
+
+
+@pytest.fixture
+def fake_ubus(ubus_backend, monkeypatch):
+    module = sys.modules[ubus_backend.__module__]
+    fake = FakeUbus()
+    monkeypatch.setattr(module, "ubus", fake)
+    monkeypatch.setattr(module, "CMDLINE_ROOT", "")
+    monkeypatch.setattr(ubus_backend, "connection", module.UbusConnection())
+    monkeypatch.setattr(
+        ubus_backend, "_call_ubus_cmd", lambda ubus_object, method, data, timeout: {"cmd": True}
+    )
+    yield fake
+
+
+def test_ubus_binding_persistent(ubus_backend, fake_ubus):
+    assert ubus_backend.call_ubus("iwinfo", "info") == {"object": "iwinfo", "method": "info"}
+    assert ubus_backend.call_ubus_many([("iwinfo", "info", None), ("system", "board", None)]) == [
+        {"object": "iwinfo", "method": "info"},
+        {"object": "system", "method": "board"},
+    ]
+    assert fake_ubus.connects == 1
+
+    # reconnects after a failure
+    fake_ubus.fail = True
+    assert ubus_backend.call_ubus("iwinfo", "info") is None
+    assert not fake_ubus.connected
+    fake_ubus.fail = False
+    assert ubus_backend.call_ubus("iwinfo", "info") == {"object": "iwinfo", "method": "info"}
+    assert fake_ubus.connects == 2
+
+    # calls are not limited in time by default
+    ubus_backend.call_ubus("iwinfo", "info", timeout=1.5)
+    assert fake_ubus.timeouts == [None] * 5 + [1500]
+
+
+def test_ubus_binding_threads(ubus_backend, fake_ubus):
+    results = [None] * 8
+
+    def worker(idx):
+        results[idx] = ubus_backend.call_ubus("system", "board")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(results))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [{"object": "system", "method": "board"}] * len(results)
+    assert fake_ubus.connects == 1
+    assert fake_ubus.max_active == 1
+
+
+def test_ubus_binding_owned_elsewhere(ubus_backend, fake_ubus):
+    # connection created by the ubus bus listener and the call is made from its callback
+    fake_ubus.connect()
+    assert ubus_backend.call_ubus("iwinfo", "info") == {"cmd": True}
+    assert ubus_backend.call_ubus_many([("iwinfo", "info", None)] * 3) == [{"cmd": True}] * 3
+
+    assert fake_ubus.connects == 1
+    assert fake_ubus.calls == []
+    assert fake_ubus.connected
@@ -0,0 +1,108 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright 2023, CZ.NIC z.s.p.o. (https://www.nic.cz/)
+
+import json
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ubus")
+
+from foris_controller.buses.ubus import (  # noqa: E402
+    RequestStorage,
+    _chunked,
+    _encode_pieces,
+    _group_modules,
+)
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setattr(RequestStorage, "data", OrderedDict())
+    monkeypatch.setattr(RequestStorage, "total_size", 0)
+    yield RequestStorage
+
+
+def test_request_storage(storage):
+    for i in range(1000):
+        assert storage.append("first", f"{i},")
+        assert storage.append("second", "x")
+
+    assert storage.pickup("first") == ",".join(str(i) for i in range(1000)) + ","
+    assert storage.total_size == 1000
+    assert storage.pickup("second") == "x" * 1000
+    assert storage.total_size == 0
+    assert storage.pickup("second") is None
+
+
+def test_request_storage_limits(storage, monkeypatch):
+    monkeypatch.setattr(RequestStorage, "MAX_REQUEST_SIZE", 10)
+    monkeypatch.setattr(RequestStorage, "MAX_TOTAL_SIZE", 15)
+
+    assert storage.append("large", "x" * 8)
+    assert not storage.append("large", "x" * 8)
+    # remaining parts of rejected request are ignored
+    assert not storage.append("large", "x")
+    assert storage.pickup("large") is None
+
+    assert storage.append("first", "x" * 8)
+    assert not storage.append("second", "x" * 8)  # total size exceeded
+    assert storage.pickup("first") == "x" * 8
+    assert storage.total_size == 0
+
+
+def test_request_storage_expire(storage, monkeypatch):
+    now = [1000.0]
+    fake_time = SimpleNamespace(monotonic=lambda: now[0])
+    monkeypatch.setattr("foris_controller.buses.ubus.time", fake_time)
+
+    storage.append("old", "x")
+    now[0] += storage.EXPIRE_TIMEOUT / 2
+    storage.append("new", "y")
+    now[0] += storage.EXPIRE_TIMEOUT / 2
+    storage.append("new", "y")
+
+    assert storage.pickup("old") is None
+    assert storage.pickup("new") == "yy"
+    assert storage.total_size == 0
+
+
+def test_chunked():
+    pieces = ["a" * i for i in range(20)]
+    chunks = list(_chunked(pieces, 7))
+    assert "".join(chunks) == "".join(pieces)
+    assert all(len(e) == 7 for e in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= 7
+
+    assert list(_chunked(["abc", "de"], 10)) == ["abcde"]
+    assert list(_chunked([], 10)) == []
+
+
+def test_encode_pieces():
+    for obj in [
+        {"data": {"leases": [{"ip": f"192.168.1.{i}", "active": i % 2 == 0} for i in range(100)]}},
+        {"data": {"nested": {"deeper": {"deepest": [1, [2, [3]]]}}, "empty": {}, "list": []}},
+        {"errors": [{"description": "Mike's \"place\" \u00e1", "stacktrace": ""}]},
+        {"data": {1: "non-str keys", None: True, 2.5: [None]}},
+        [],
+        "string",
+    ]:
+        assert "".join(_encode_pieces(obj)) == json.dumps(obj)
+
+    # large lists are serialized in batches
+    obj = {"data": {"items": list(range(10000)), "small": list(range(10))}}
+    assert "".join(_encode_pieces(obj)) == json.dumps(obj)
+    assert len(list(_encode_pieces(obj))) > 10
+
+
+def test_group_modules():
+    modules = [(f"module{i}", None) for i in range(5)]
+
+    groups = _group_modules(modules, 2)
+    assert [[name for name, _ in group] for group in groups] == [
+        ["module0", "module2", "module4"],
+        ["module1", "module3"],
+    ]
+    assert len(_group_modules(modules, 0)) == 5
+    assert len(_group_modules(modules, 10)) == 5
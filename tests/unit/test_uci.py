@@ -508,3 +508,206 @@ def test_strange_chars_in_value(uci_configs_init, lock_backend):
     assert [e for e in SPECIAL_VALUES] == uci.get_option_named(
         data, "test1", "special_values", "my_list"
     )
+
+
+@pytest.mark.uci_config_path(CONFIG_PATH)
+def test_batch(uci_configs_init, lock_backend):
+    config_dir, _ = uci_configs_init
+    uci = get_uci_module(lock_backend)
+    backend_class = uci.UciBackend
+
+    with backend_class(config_dir, batch=True) as backend:
+        backend.del_section("test2", "named2")
+        backend.add_section("test2", "named", "named2")
+        backend.set_option("test2", "named2", "new_option", "Mike's place")
+        backend.replace_list("test2", "named2", "new_list", ["val 1", "val 2"])
+        backend.del_option("test2", "named1", "non_existing", fail_on_error=False)
+        # nothing is written till the batch is flushed
+        assert "test2.named2.new_option" not in show(config_dir)
+
+        # read flushes the batch
+        data = backend.read("test2")
+        assert uci.get_option_named(data, "test2", "named2", "new_option") == "Mike's place"
+        assert uci.get_option_named(data, "test2", "named2", "new_list") == ["val 1", "val 2"]
+
+        a_name = backend.add_section("test2", "anonymous").strip()
+        backend.set_option("test2", a_name, "new_option", "valuea")
+
+    assert "test2.named2.new_option='Mike'\\''s place'" in show(config_dir)
+    assert "test2.named2.new_list='val 1' 'val 2'" in show(config_dir)
+    assert "test2.@anonymous[2].new_option='valuea'" in show(config_dir)
+
+    with pytest.raises(UciException):
+        with backend_class(config_dir, batch=True) as backend:
+            backend.set_option("test2", "named1", "option1", "batched")
+            backend.set_option("test2", "named3", "option1", "non-existing")
+
+    assert "test2.named1.option1" not in show(config_dir)
+    assert "test2.named3.option1" not in show(config_dir)
+
+
+@pytest.mark.uci_config_path(CONFIG_PATH)
+def test_batch_missing_deletes(uci_configs_init, lock_backend, monkeypatch):
+    config_dir, _ = uci_configs_init
+    uci = get_uci_module(lock_backend)
+    backend_class = uci.UciBackend
+
+    calls = []
+    orig_handle_command = uci.handle_command
+
+    def handle_command(*args, **kwargs):
+        calls.append(args)
+        return orig_handle_command(*args, **kwargs)
+
+    monkeypatch.setattr(uci, "handle_command", handle_command)
+
+    with backend_class(config_dir, batch=True) as backend:
+        backend.del_option("test2", "@anonymous[5]", "option1", fail_on_error=False)
+        backend.add_section("test2", "named", "named1")
+        backend.set_option("test2", "named1", "option1", "batched")
+        backend.del_option("test2", "named1", "non_existing", fail_on_error=False)
+        backend.del_section("test2", "non_existing", fail_on_error=False)
+        backend.replace_list("test2", "named1", "new_list", ["val 1", "val 2"])
+        # option added within the same batch is deleted
+        backend.set_option("test2", "named2", "new_option", "value")
+        backend.del_option("test2", "named2", "new_option", fail_on_error=False)
+        backend.flush()
+
+    uci_calls = [e for e in calls if e[0] == "uci" and "commit" not in e and "revert" not in e]
+    assert len(uci_calls) == 1
+    assert uci_calls[0][-1] == "batch"
+
+    assert "test2.named1.option1='batched'" in show(config_dir)
+    assert "test2.named1.new_list='val 1' 'val 2'" in show(config_dir)
+    assert "test2.named2.new_option" not in show(config_dir)
+
+
+READ_SYNTAX_DATA = """
+# comment
+package read_syntax
+
+config "quoted" 'named'
+	option single 'Mike'\\''s place' # comment
+	option double "double \\"quoted\\""
+	option unquoted value
+	option multiline 'line 1
+line 2'
+	list items first
+	list items 'second item'
+
+config anonymous
+	option 'long' \\
+		value
+
+config anonymous
+"""  # noqa
+
+
+@pytest.mark.uci_config_path(CONFIG_PATH)
+def test_read_syntax(uci_configs_init, lock_backend):
+    config_dir, _ = uci_configs_init
+    uci = get_uci_module(lock_backend)
+    backend_class = uci.UciBackend
+
+    with open(os.path.join(config_dir, "read_syntax"), "w") as f:
+        f.write(READ_SYNTAX_DATA)
+
+    with backend_class(config_dir) as backend:
+        backend.set_option("read_syntax", "named", "changed", "new value")
+        backend.del_option("read_syntax", "@anonymous[0]", "long")
+        backend.add_to_list("read_syntax", "named", "items", ["third"])
+        data = backend.read("read_syntax")
+
+    assert uci.get_section(data, "read_syntax", "named") == {
+        "type": "quoted",
+        "name": "named",
+        "anonymous": False,
+        "data": OrderedDict(
+            [
+                ("single", "Mike's place"),
+                ("double", 'double "quoted"'),
+                ("unquoted", "value"),
+                ("multiline", "line 1\nline 2"),
+                ("items", ["first", "second item", "third"]),
+                ("changed", "new value"),
+            ]
+        ),
+    }
+    assert uci.get_sections_by_type(data, "read_syntax", "anonymous")[0]["data"] == OrderedDict()
+
+    # anonymous section names match the names generated by uci
+    process = subprocess.Popen(
+        ["uci", "-X", "-c", config_dir, "show", "read_syntax"], stdout=subprocess.PIPE
+    )
+    stdout, _ = process.communicate()
+    for section in uci.get_sections_by_type(data, "read_syntax", "anonymous"):
+        assert section["anonymous"] is True
+        assert "read_syntax.%s=anonymous" % section["name"] in stdout.decode("utf-8")
+
+
+@pytest.mark.uci_config_path(CONFIG_PATH)
+def test_read_cache(uci_configs_init, lock_backend):
+    config_dir, _ = uci_configs_init
+    uci = get_uci_module(lock_backend)
+    backend_class = uci.UciBackend
+
+    with backend_class(config_dir) as backend:
+        data1 = backend.read("test2")
+        data2 = backend.read("test2")
+        assert data1 == data2
+        assert [e for e in backend_class.read_cache if e[:2] == (config_dir, "test2")]
+
+        # cached data are not affected by modification of the returned data
+        uci.get_section(data1, "test2", "named2")["data"]["list1"].append("modified")
+        assert backend.read("test2") == data2
+
+        # pending changes are visible
+        backend.set_option("test2", "named2", "option1", "changed")
+        assert uci.get_option_named(backend.read("test2"), "test2", "named2", "option1") == "changed"
+
+    assert not [e for e in backend_class.read_cache if e[:2] == (config_dir, "test2")]
+
+    with backend_class(config_dir) as backend:
+        assert uci.get_option_named(backend.read("test2"), "test2", "named2", "option1") == "changed"
+
+
+@pytest.mark.uci_config_path(CONFIG_PATH)
+def test_reader(uci_configs_init, lock_backend):
+    config_dir, _ = uci_configs_init
+    uci = get_uci_module(lock_backend)
+
+    with uci.UciReader(config_dir) as reader1, uci.UciReader(config_dir) as reader2:
+        assert reader1.read("test2") == reader2.read("test2")
+        assert uci.get_option_named(reader1.read("test2"), "test2", "named2", "option2") == "xxx"
+        with pytest.raises(UciException):
+            reader2.read("non-existing")
+        assert not hasattr(reader1, "set_option")
+
+    # uncommited changes are not visible
+    with pytest.raises(RuntimeError):
+        with uci.UciBackend(config_dir) as backend:
+            backend.set_option("test2", "named2", "option2", "changed")
+            raise RuntimeError()
+
+    with uci.UciReader(config_dir) as reader:
+        assert uci.get_option_named(reader.read("test2"), "test2", "named2", "option2") == "xxx"
+
+
+def test_indexed_config(lock_backend):
+    uci = get_uci_module(lock_backend)
+    sections = [
+        {"type": "named", "name": "named1", "data": OrderedDict(), "anonymous": False},
+        {"type": "anonymous", "name": "cfg02e38e", "data": OrderedDict(), "anonymous": True},
+        {"type": "named", "name": "named2", "data": OrderedDict([("opt", "1")]), "anonymous": False},
+    ]
+
+    # indexed as well as plain lists are supported
+    for data in ({"test": uci.UciConfig(sections)}, {"test": sections}):
+        assert data["test"] == sections
+        assert uci.get_section(data, "test", "named2") is sections[2]
+        assert uci.get_sections_by_type(data, "test", "named") == [sections[0], sections[2]]
+        assert uci.get_sections_by_type(data, "test", "non_existing") == []
+        assert uci.get_option_anonymous(data, "test", "named", 1, "opt") == "1"
+        assert uci.get_option_named(data, "test", "named2", "opt") == "1"
+        with pytest.raises(UciRecordNotFound):
+            uci.get_section(data, "test", "non_existing")
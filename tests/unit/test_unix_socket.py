@@ -0,0 +1,187 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright 2023, CZ.NIC z.s.p.o. (https://www.nic.cz/)
+
+import json
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from foris_controller import compression
+from foris_controller.buses.unix_socket import (
+    AsyncUnixSocketListener,
+    PIPELINED_FLAG,
+    UnixSocketListener,
+)
+
+
+def send(sock, data, request_id=None):
+    data = json.dumps(data).encode("utf8")
+    if request_id is None:
+        sock.sendall(struct.pack("I", len(data)) + data)
+    else:
+        sock.sendall(struct.pack("II", len(data) | PIPELINED_FLAG, request_id) + data)
+
+
+def recv_exactly(sock, length):
+    data = b""
+    while len(data) < length:
+        data += sock.recv(length - len(data))
+    return data
+
+
+def recv(sock, raw=False):
+    length = struct.unpack("I", recv_exactly(sock, 4))[0]
+    data = recv_exactly(sock, length)
+    return data if raw else json.loads(data)
+
+
+def recv_pipelined(sock):
+    length = struct.unpack("I", recv_exactly(sock, 4))[0]
+    assert length & PIPELINED_FLAG
+    request_id = struct.unpack("I", recv_exactly(sock, 4))[0]
+    return request_id, json.loads(recv_exactly(sock, length & ~PIPELINED_FLAG))
+
+
+def start_listener(kind, tmp_path, monkeypatch):
+    def process_message(self, message):
+        if message["action"] == "slow":
+            time.sleep(0.5)
+        reply = {"kind": "reply", "module": message["module"], "action": message["action"]}
+        if message["action"] == "large":
+            reply["data"] = {"items": [{"index": i} for i in range(1000)]}
+        return reply
+
+    monkeypatch.setattr("foris_controller.message_router.Router.process_message", process_message)
+
+    socket_path = str(tmp_path / "controller.soc")
+    if kind == "async":
+        listener = AsyncUnixSocketListener(socket_path, workers=4)
+    else:
+        listener = UnixSocketListener(socket_path)
+        # don't wait for the clients on teardown
+        listener.block_on_close = False
+        listener.daemon_threads = True
+    threading.Thread(target=listener.serve_forever, daemon=True).start()
+
+    for _ in range(100):
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(socket_path)
+            sock.close()
+            break
+        except (FileNotFoundError, ConnectionRefusedError):
+            time.sleep(0.05)
+
+    yield socket_path
+    if kind == "threaded":
+        listener.shutdown()
+        listener.server_close()
+
+
+@pytest.fixture
+def async_listener(tmp_path, monkeypatch):
+    yield from start_listener("async", tmp_path, monkeypatch)
+
+
+@pytest.fixture(params=["async", "threaded"])
+def listener(request, tmp_path, monkeypatch):
+    yield from start_listener(request.param, tmp_path, monkeypatch)
+
+
+def test_async_listener(async_listener):
+    sockets = []
+    for i in range(10):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(async_listener)
+        sockets.append(sock)
+
+    for i, sock in enumerate(sockets):
+        send(sock, {"kind": "request", "module": "test", "action": f"action{i}"})
+        # partially sent message is completed later
+        data = json.dumps({"kind": "request", "module": "test", "action": "second"}).encode("utf8")
+        sock.sendall(struct.pack("I", len(data)) + data[:5])
+        sock.sendall(data[5:])
+
+    for i, sock in enumerate(sockets):
+        assert recv(sock) == {"kind": "reply", "module": "test", "action": f"action{i}"}
+        assert recv(sock) == {"kind": "reply", "module": "test", "action": "second"}
+        sock.close()
+
+
+def test_async_listener_pipelined(async_listener):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(async_listener)
+
+    send(sock, {"kind": "request", "module": "test", "action": "slow"}, request_id=1)
+    send(sock, {"kind": "request", "module": "test", "action": "fast"}, request_id=2)
+    send(sock, {"kind": "request", "module": "test", "action": "fast"}, request_id=3)
+
+    # replies are sent as soon as they are ready
+    replies = [recv_pipelined(sock) for _ in range(3)]
+    assert replies[-1] == (1, {"kind": "reply", "module": "test", "action": "slow"})
+    assert sorted(replies[:2]) == [
+        (2, {"kind": "reply", "module": "test", "action": "fast"}),
+        (3, {"kind": "reply", "module": "test", "action": "fast"}),
+    ]
+
+    # plain frames can be mixed with the pipelined ones
+    send(sock, {"kind": "request", "module": "test", "action": "plain"})
+    assert recv(sock) == {"kind": "reply", "module": "test", "action": "plain"}
+
+    # pending replies are sent even when the client stops sending
+    send(sock, {"kind": "request", "module": "test", "action": "slow"}, request_id=4)
+    sock.shutdown(socket.SHUT_WR)
+    assert recv_pipelined(sock) == (4, {"kind": "reply", "module": "test", "action": "slow"})
+    sock.close()
+
+
+def test_async_listener_compression(async_listener):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(async_listener)
+    large = {
+        "kind": "reply",
+        "module": "test",
+        "action": "large",
+        "data": {"items": [{"index": i} for i in range(1000)]},
+    }
+
+    send(sock, {"kind": "request", "module": "test", "action": "large", "compression": "zlib"})
+    raw = recv(sock, raw=True)
+    assert json.loads(raw).keys() == {"compression", "payload"}
+    assert len(raw) < len(json.dumps(large))
+    assert compression.decode(raw) == large
+
+    # small replies are not compressed
+    send(sock, {"kind": "request", "module": "test", "action": "small", "compression": "zlib"})
+    assert recv(sock) == {"kind": "reply", "module": "test", "action": "small"}
+
+    # compression is opt-in
+    send(sock, {"kind": "request", "module": "test", "action": "large"})
+    assert recv(sock) == large
+    sock.close()
+
+
+def test_pipelined_wrong_data(listener):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5)  # fail instead of waiting forever for the reply
+    sock.connect(listener)
+
+    send(sock, {"kind": "request", "module": "test", "action": "first"}, request_id=1)
+    assert recv_pipelined(sock) == (1, {"kind": "reply", "module": "test", "action": "first"})
+
+    # pipelined client is waiting for the reply with the request id
+    data = b"{not a json"
+    sock.sendall(struct.pack("II", len(data) | PIPELINED_FLAG, 2) + data)
+    request_id, reply = recv_pipelined(sock)
+    assert request_id == 2
+    assert reply["errors"] == [{"description": "Wrong data received."}]
+
+    # plain frame with wrong data is not replied
+    sock.sendall(struct.pack("I", len(data)) + data)
+
+    send(sock, {"kind": "request", "module": "test", "action": "third"}, request_id=3)
+    assert recv_pipelined(sock) == (3, {"kind": "reply", "module": "test", "action": "third"})
+    sock.close()